@@ -0,0 +1,125 @@
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+import statistics
+import time
+import tracemalloc
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GMM_DIR = os.path.join(BASE_DIR, "gmm-gmr")
+sys.path.append(GMM_DIR)
+
+from mixtures import GMM_GMR
+from utils import align_trajectories
+
+STAGES = ("align", "pca", "fit", "generate")
+
+def synthetic_demos(rng, n, t, d):
+    """
+    n smooth (T_i, d) demonstrations of one motion, with lengths within 10% of t, random time
+    warps, offsets and noise, so alignment has real work to do.
+    """
+    frequencies = rng.uniform(0.5, 2.0, d)
+    phases = rng.uniform(0.0, np.pi, d)
+    demos = []
+    for _ in range(n):
+        length = int(t * rng.uniform(0.9, 1.1))
+        s = np.linspace(0.0, 1.0, length) ** rng.uniform(0.8, 1.25)
+        demo = np.sin(np.pi * frequencies * s[:, None] + phases) * 0.2 + rng.normal(0.0, 0.01, d)
+        demos.append(demo + rng.normal(0.0, 0.002, demo.shape))
+    return demos
+
+def run_stages(demos, k, seed):
+    """
+    Runs the learning stack once, returning each stage's output so the next can use it.
+    """
+    from sklearn.decomposition import PCA
+    n_pca = min(3, demos[0].shape[1])
+    aligned = np.array(align_trajectories(demos))
+    yield "align"
+    PCA(n_pca).fit_transform(aligned.reshape(-1, aligned.shape[2]))
+    yield "pca"
+    gmm_gmr = GMM_GMR(aligned, n_pca)
+    # fit is the PCA, the BIC sweep over 2..k gaussians and the final fit, as main.py runs it
+    with contextlib.redirect_stdout(io.StringIO()):
+        gmm_gmr.fit(components=range(2, k + 1), random_state=seed)
+    yield "fit"
+    gmm_gmr.generate_trajectory(num_samples=100)
+    yield "generate"
+
+def time_stages(demos, k, seed):
+    times = {}
+    start = time.perf_counter()
+    for stage in run_stages(demos, k, seed):
+        now = time.perf_counter()
+        times[stage] = now - start
+        start = now
+    return times
+
+def peak_memory(demos, k, seed):
+    # Separate pass, tracemalloc slows allocations down too much to time with it on
+    peaks = {}
+    tracemalloc.start()
+    for stage in run_stages(demos, k, seed):
+        peaks[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+    tracemalloc.stop()
+    return peaks
+
+def benchmark(n, t, d, k, repeats, seed):
+    demos = synthetic_demos(np.random.default_rng(seed), n, t, d)
+    samples = [time_stages(demos, k, seed) for _ in range(repeats)]
+    peaks = peak_memory(demos, k, seed)
+    return {
+        "n": n, "t": t, "d": d, "k": k,
+        "median_ms": { stage: statistics.median(s[stage] for s in samples) * 1000 for stage in STAGES },
+        "peak_kb": { stage: peaks[stage] / 1024 for stage in STAGES },
+    }
+
+def scaling_exponent(values, times):
+    # Slope of log(time) against log(value), i.e. time ~ value^slope
+    if len(values) < 2:
+        return float("nan")
+    return float(np.polyfit(np.log(values), np.log(np.maximum(times, 1e-9)), 1)[0])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and measure the GMM-GMR learning stack on synthetic demonstrations")
+    parser.add_argument("--n", type=int, nargs="+", default=[5, 10, 20], help="Numbers of demonstrations")
+    parser.add_argument("--t", type=int, nargs="+", default=[25, 50, 100], help="Samples per demonstration")
+    parser.add_argument("--d", type=int, default=3, help="Dimensions")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 7], help="Largest number of gaussians in the BIC sweep")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Optional path for the raw results")
+    args = parser.parse_args(argv)
+
+    # Each axis is swept with the others held at their middle value
+    base = { "n": args.n[len(args.n) // 2], "t": args.t[len(args.t) // 2], "k": args.k[len(args.k) // 2] }
+    results = { "d": args.d, "base": base, "sweeps": {} }
+    # Warm-up, so the lazy imports are not timed as part of the first configuration
+    time_stages(synthetic_demos(np.random.default_rng(args.seed), 3, 10, args.d), 2, args.seed)
+    for axis, values in (("n", args.n), ("t", args.t), ("k", args.k)):
+        print(f"\nScaling with {axis.upper()} ({', '.join(f'{a.upper()}={v}' for a, v in base.items() if a != axis)}, D={args.d})")
+        print(f"{axis.upper():>6s} " + " ".join(f"{stage + ' (ms)':>14s}" for stage in STAGES) + f" {'peak (KB)':>10s}")
+        rows = []
+        for value in values:
+            params = dict(base, **{ axis: value })
+            row = benchmark(params["n"], params["t"], args.d, params["k"], args.repeats, args.seed)
+            rows.append(row)
+            print(f"{value:6d} " + " ".join(f"{row['median_ms'][stage]:14.1f}" for stage in STAGES)
+                  + f" {max(row['peak_kb'].values()):10.0f}")
+        exponents = { stage: scaling_exponent(values, [row["median_ms"][stage] for row in rows]) for stage in STAGES }
+        print(f"{'slope':>6s} " + " ".join(f"{exponents[stage]:14.2f}" for stage in STAGES))
+        results["sweeps"][axis] = { "rows": rows, "exponents": exponents }
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
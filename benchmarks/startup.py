@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_DIR = os.path.join(BASE_DIR, "demonstration_collection")
+GMM_DIR = os.path.join(BASE_DIR, "gmm-gmr")
+
+# (name, working directory, python arguments)
+TARGETS = [
+    ("python (baseline)", BASE_DIR, ["-c", "pass"]),
+    ("import utils", GMM_DIR, ["-c", "import utils"]),
+    ("import mixtures", GMM_DIR, ["-c", "import mixtures"]),
+    ("import skill", GMM_DIR, ["-c", "import skill"]),
+    ("import main", GMM_DIR, ["-c", "import main"]),
+    ("import sweep", GMM_DIR, ["-c", "import sweep"]),
+    ("import apply_skill_to_block", GMM_DIR, ["-c", "import apply_skill_to_block"]),
+    ("import smooth_demonstrations", DEMO_DIR, ["-c", "import smooth_demonstrations"]),
+    ("import collect_demonstration", DEMO_DIR, ["-c", "import collect_demonstration"]),
+    ("import pipeline", BASE_DIR, ["-c", "import pipeline"]),
+    ("main.py --help", GMM_DIR, ["main.py", "--help"]),
+    ("apply_skill_to_block.py --list-skills", GMM_DIR, ["apply_skill_to_block.py", "--list-skills"]),
+    ("import sklearn.mixture (reference)", GMM_DIR, ["-c", "import sklearn.mixture"]),
+]
+
+def time_command(cwd, args, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, result.stderr.decode().strip().splitlines()[-1]
+    return samples, None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure startup time of the project's modules and commands")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", default=None, help="Optional path for the raw results")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'target':45s} {'median (ms)':>12s} {'min (ms)':>10s}")
+    for name, cwd, command in TARGETS:
+        samples, error = time_command(cwd, command, args.repeats)
+        if samples is None:
+            print(f"{name:45s} failed: {error}")
+            results.append({ "target": name, "error": error })
+            continue
+        median = statistics.median(samples) * 1000
+        print(f"{name:45s} {median:12.1f} {min(samples) * 1000:10.1f}")
+        results.append({ "target": name, "median_ms": median, "min_ms": min(samples) * 1000 })
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
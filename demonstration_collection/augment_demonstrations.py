@@ -0,0 +1,97 @@
+import os
+import argparse
+import numpy as np
+
+# Random smooth, monotone time warps, one per row of tau: (count, m) normalized times in [0, 1]
+def time_warps(rng, tau, amplitude=0.1, modes=3):
+    count = len(tau)
+    k = np.arange(1, modes + 1)
+    # Sine modes vanish at both ends; keeping sum |a_k| * k * pi below 1 keeps the warp monotone
+    coefficients = rng.uniform(-1.0, 1.0, (count, modes)) / (k * modes)
+    coefficients *= min(amplitude, 0.99) / np.pi
+    return tau + np.einsum('ck,ckm->cm', coefficients, np.sin(np.pi * k[None, :, None] * tau[:, None, :]))
+
+# Samples every trajectory at its own warped times, trajectory is (n, d), warps is (count, m)
+def warp_trajectory(trajectory, warps):
+    n = len(trajectory)
+    position = np.clip(warps, 0.0, 1.0) * (n - 1)
+    lower = np.minimum(np.floor(position).astype(int), n - 2)
+    fraction = (position - lower)[..., None]
+    return (1.0 - fraction) * trajectory[lower] + fraction * trajectory[lower + 1]
+
+# Smooth spatial perturbations that vanish at the start and at the end, so the grasp or place
+# point the demo is relative to stays exactly where it was demonstrated
+def spatial_perturbations(rng, tau, dims, offset=0.01):
+    bump = np.sin(np.pi * tau)
+    offsets = rng.normal(0.0, offset, (len(tau), 1, dims))
+    return offsets * bump[:, :, None]
+
+def augment_demonstration(timestamps, positions, count, rng, warp=0.1, offset=0.01, speed_range=(0.8, 1.2)):
+    """
+    Generates count synthetic demos from one recorded demo, all at once.
+
+    :param warp: Strength of the time warps, 0 keeps the original timing.
+    :param offset: Standard deviation (m) of the offset added along the middle of the motion.
+    :param speed_range: Range of the uniform speed scaling. A demo played at speed s is resampled
+        to n / s samples at the original sample period, as a slower or faster recording would be.
+    :return: List of count (m_i,) timestamps, list of count (m_i, d) positions and (count,) speed factors.
+    """
+    n, dims = positions.shape
+    speeds = rng.uniform(speed_range[0], speed_range[1], count)
+    lengths = np.maximum(2, np.round(n / speeds).astype(int))
+    # One padded grid for the whole batch, row i only uses its first lengths[i] samples
+    tau = np.minimum(np.arange(lengths.max())[None, :] / (lengths[:, None] - 1), 1.0)
+    augmented = warp_trajectory(positions, time_warps(rng, tau, warp)) + spatial_perturbations(rng, tau, dims, offset)
+    dt = (timestamps[-1] - timestamps[0]) / (n - 1)
+    all_timestamps = [timestamps[0] + np.arange(m) * dt for m in lengths]
+    return all_timestamps, [augmented[i, :m] for i, m in enumerate(lengths)], speeds
+
+def augment_folder(folder_path, count=20, seed=0, warp=0.1, offset=0.01, speed_range=(0.8, 1.2)):
+    import h5py
+    rng = np.random.default_rng(seed)
+    files = sorted(f for f in os.listdir(folder_path) if f.endswith('.h5') and not f.startswith('augmented_'))
+    written = 0
+    for filename in files:
+        filepath = os.path.join(folder_path, filename)
+        with h5py.File(filepath, 'r') as f:
+            attrs = dict(f.attrs)
+            if "skill_name" not in attrs.keys() or "augmented_from" in attrs.keys():
+                print(f"Skipping {filepath}")
+                continue
+            timestamps = np.array(f["timestamps"])
+            positions = np.array(f["eef_positions"])
+
+        all_timestamps, all_positions, speeds = augment_demonstration(timestamps, positions, count, rng, warp, offset, speed_range)
+
+        stem = os.path.splitext(filename)[0]
+        for i in range(count):
+            with h5py.File(os.path.join(folder_path, f"augmented_{stem}_{i + 1}.h5"), 'w') as f:
+                f.attrs.update(attrs)
+                # Provenance, so synthetic demos can always be told apart from recorded ones
+                f.attrs["augmented_from"] = filename
+                f.attrs["augment_seed"] = seed
+                f.attrs["augment_index"] = i
+                f.attrs["augment_warp"] = warp
+                f.attrs["augment_offset"] = offset
+                f.attrs["augment_speed"] = speeds[i]
+                f.create_dataset("timestamps", data=all_timestamps[i])
+                f.create_dataset("eef_positions", data=all_positions[i])
+        written += count
+        print(f"Wrote {count} augmented demonstrations from {filename}")
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic demonstrations from the smoothed ones")
+    parser.add_argument("--folder", default="smoothed_demonstrations")
+    parser.add_argument("--count", type=int, default=20, help="Synthetic demos per recorded demo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warp", type=float, default=0.1, help="Time warp strength, below 1")
+    parser.add_argument("--offset", type=float, default=0.01, help="Standard deviation (m) of the offset along the middle of the motion")
+    parser.add_argument("--speed-range", type=float, nargs=2, default=[0.8, 1.2], help="Range of the speed scaling, applied by resampling the positions")
+    args = parser.parse_args(argv)
+
+    written = augment_folder(args.folder, args.count, args.seed, args.warp, args.offset, tuple(args.speed_range))
+    print(f"Wrote {written} augmented demonstrations to {args.folder}")
+
+if __name__ == "__main__":
+    main()
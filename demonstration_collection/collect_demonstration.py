@@ -2,30 +2,15 @@ import sys
 sys.path.append('..')
 import os
 import re
-import robosuite as suite
-from robosuite.models.objects import BoxObject
-from environments import pick_place_custom
-import mujoco
-import pygame
-import h5py
 import numpy as np
 import time
 import math
+import queue
+import argparse
+import threading
 from enum import IntEnum
 from dataclasses import dataclass
-
-folder_path = "demonstrations"
-if not os.path.exists(folder_path):
-    os.makedirs(folder_path)
-
-# Joystick setup
-found_controller = False
-pygame.init()
-pygame.joystick.init()
-if pygame.joystick.get_count() != 0:
-    found_controller = True
-    joystick = pygame.joystick.Joystick(0)
-    joystick.init()
+from environments.rendering import add_render_arguments, with_rendering
 
 # Controls Class
 @dataclass
@@ -83,75 +68,36 @@ def above_inplace(output):
     height = print_inplace.inplace_line_count
     print(f"\033[{height}F{output}", end=f"\033[0K\033[{height}E\n{margin}", flush=True)
 
-# Create cubes
-box_r = BoxObject(
-    name="red",
-    size=[0.02, 0.02, 0.02],
-    rgba=[1, 0, 0, 1]
-)
-box_g = BoxObject(
-    name="green",
-    size=[0.02, 0.02, 0.02],
-    rgba=[0, 1, 0, 1]
-)
-box_b = BoxObject(
-    name="blue",
-    size=[0.02, 0.02, 0.02],
-    rgba=[0, 0, 1, 1]
-)
-
-# Create env
-env = suite.make(
-    env_name="PickPlaceCustom",
-    robots="UR5e",
-    has_renderer=True,
-    has_offscreen_renderer=False,
-    use_camera_obs=False,
-    control_freq=20,
-    initialization_noise=None,
-    # Horizon is length of sim, we set it absurdly high since we want
-    # the user to end the demo manually using controller input
-    horizon=5000000,
-    use_initializer=False,
-    blocks=[box_r]
-)
-
-# Prompt user for skill information
-print("\n ────────────────── Skill Info ──────────────────\n ────────────────────────────────────────────────\033[1F")
-skill_name_in = input(f"\033[2K   PDDL Action: \n ────────────────────────────────────────────────\033[1F\033[16C")
-skill_target_idx_in = input(f"\033[2K   PDDL Target Index: \n ────────────────────────────────────────────────\033[1F\033[22C")
-ref_body_id = None
-if skill_target_idx_in != "":
-    skill_coord_ref = input(f"\033[2K   Demo Target Name: \n ────────────────────────────────────────────────\033[1F\033[21C")
-    bad_target_name = False
-    while not any(target.startswith(skill_coord_ref + "_") for target in env.sim.model.body_names):
-        bad_target_name = True
-        print(f"\033[2E\033[2K   \033[91mTarget {skill_coord_ref} not found in environment!\033[0m\n ────────────────────────────────────────────────", end="\033[2F")
-        skill_coord_ref = input(f"\033[2K   Demo Target Name: ")
-        print("\033[2F", end="")
-    possible_ref_names = [target for target in env.sim.model.body_names if target.startswith(skill_coord_ref + "_")]
-    ref_body_id = env.sim.model.body_name2id(possible_ref_names[0]) if skill_coord_ref != "" else None
-    if bad_target_name:
-        print("\033[2E\033[2K ────────────────────────────────────────────────", end="\n\033[2K\n")
-else:
-    print("\033[1E\n")
-
-obs = env.reset()
-running = True
-start_time = time.time()
-last_render_time = start_time
-env.visualize(vis_settings = { "robots": False, "grippers": True, "env": False })
-
-actuator_info = env.sim.data.qfrc_actuator
-gripper_id = env.sim.model.actuator_name2id('gripper0_right_finger_1')
-attributes = { "skill_name": f"SK{time.time()}" if skill_name_in == "" else skill_name_in,
-               "grip_initial": False,
-               "grip_final": False,
-               "target_idx": int(skill_target_idx_in) if skill_target_idx_in.isnumeric() else -1 }
-position_offset = -env.sim.data.body_xpos[ref_body_id] if ref_body_id else None
-eef_positions = [] 
-actions = []
-timestamps = []
+# Side thread that owns the terminal so printing doesn't slow down the control loop
+class TerminalUI(threading.Thread):
+    def __init__(self, rate=10.0):
+        super().__init__(daemon=True)
+        self.period = 1.0 / rate
+        self.controls = Controls()
+        self.status = None
+        self.messages = queue.Queue()
+        self.running = True
+
+    def post(self, message):
+        self.messages.put(message)
+
+    def run(self):
+        next_frame = time.perf_counter()
+        while self.running:
+            while not self.messages.empty():
+                above_inplace(self.messages.get())
+            status, self.status = self.status, None
+            if status is not None:
+                above_inplace(status)
+            print_inplace(f"{self.controls}")
+            next_frame += self.period
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+        while not self.messages.empty():
+            above_inplace(self.messages.get())
+
+    def stop(self):
+        self.running = False
+        self.join()
 
 # Sensitivity multipliers (may change with different controllers)
 arm_scaling = 0.125
@@ -165,154 +111,291 @@ def apply_deadzone(value, threshold):
         return 0.0
     return value * (abs(value) - threshold) / (1 - threshold)  # llm generated smoothing
 
-button_held = [False] * 4
-recording = False
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record a teleoperated demonstration")
+    add_render_arguments(parser, mode="threaded", fps=20.0)
+    args = parser.parse_args(argv)
 
-# Demonstration loop
-while running:
-    # Prepare controls for input
-    controls = Controls()
-    
-    # Break condition, event get as well
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    # Simulator, controller and file libraries are imported here so importing this module stays cheap
+    import robosuite as suite
+    from robosuite.models.objects import BoxObject
+    from environments import pick_place_custom
+    import pygame
+    import h5py
+
+    folder_path = "demonstrations"
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    # Joystick setup
+    found_controller = False
+    pygame.init()
+    pygame.joystick.init()
+    if pygame.joystick.get_count() != 0:
+        found_controller = True
+        joystick = pygame.joystick.Joystick(0)
+        joystick.init()
+
+    # Create cubes
+    box_r = BoxObject(
+        name="red",
+        size=[0.02, 0.02, 0.02],
+        rgba=[1, 0, 0, 1]
+    )
+    box_g = BoxObject(
+        name="green",
+        size=[0.02, 0.02, 0.02],
+        rgba=[0, 1, 0, 1]
+    )
+    box_b = BoxObject(
+        name="blue",
+        size=[0.02, 0.02, 0.02],
+        rgba=[0, 0, 1, 1]
+    )
+
+    # Create env
+    env = suite.make(
+        env_name="PickPlaceCustom",
+        robots="UR5e",
+        has_renderer=args.render != "none",
+        has_offscreen_renderer=False,
+        use_camera_obs=False,
+        control_freq=20,
+        initialization_noise=None,
+        # Horizon is length of sim, we set it absurdly high since we want
+        # the user to end the demo manually using controller input
+        horizon=5000000,
+        use_initializer=False,
+        blocks=[box_r]
+    )
+    # Rendering only blocks the fixed-rate loop for a state copy in threaded mode
+    env = with_rendering(env, args.render, args.render_every, args.render_fps)
+
+    # Prompt user for skill information
+    print("\n ────────────────── Skill Info ──────────────────\n ────────────────────────────────────────────────\033[1F")
+    skill_name_in = input(f"\033[2K   PDDL Action: \n ────────────────────────────────────────────────\033[1F\033[16C")
+    skill_target_idx_in = input(f"\033[2K   PDDL Target Index: \n ────────────────────────────────────────────────\033[1F\033[22C")
+    ref_body_id = None
+    if skill_target_idx_in != "":
+        skill_coord_ref = input(f"\033[2K   Demo Target Name: \n ────────────────────────────────────────────────\033[1F\033[21C")
+        bad_target_name = False
+        while not any(target.startswith(skill_coord_ref + "_") for target in env.sim.model.body_names):
+            bad_target_name = True
+            print(f"\033[2E\033[2K   \033[91mTarget {skill_coord_ref} not found in environment!\033[0m\n ────────────────────────────────────────────────", end="\033[2F")
+            skill_coord_ref = input(f"\033[2K   Demo Target Name: ")
+            print("\033[2F", end="")
+        possible_ref_names = [target for target in env.sim.model.body_names if target.startswith(skill_coord_ref + "_")]
+        ref_body_id = env.sim.model.body_name2id(possible_ref_names[0]) if skill_coord_ref != "" else None
+        if bad_target_name:
+            print("\033[2E\033[2K ────────────────────────────────────────────────", end="\n\033[2K\n")
+    else:
+        print("\033[1E\n")
+
+    obs = env.reset()
+    running = True
+    env.visualize(vis_settings = { "robots": False, "grippers": True, "env": False })
+
+    actuator_info = env.sim.data.qfrc_actuator
+    gripper_id = env.sim.model.actuator_name2id('gripper0_right_finger_1')
+    attributes = { "skill_name": f"SK{time.time()}" if skill_name_in == "" else skill_name_in,
+                   "grip_initial": False,
+                   "grip_final": False,
+                   "target_idx": int(skill_target_idx_in) if skill_target_idx_in.isnumeric() else -1 }
+    position_offset = -env.sim.data.body_xpos[ref_body_id] if ref_body_id else None
+    eef_positions = [] 
+    actions = []
+    timestamps = []
+    initial_state = None
+
+    button_held = [False] * 4
+    recording = False
+
+    # The loop runs on absolute deadlines at the control frequency, so samples are evenly spaced
+    control_period = 1.0 / env.control_freq
+    ui = TerminalUI()
+    ui.start()
+    loop_lateness = []
+    loop_overruns = 0
+    next_deadline = time.perf_counter() + control_period
+
+    # Demonstration loop
+    while running:
+        # Prepare controls for input
+        controls = Controls()
+
+        # Break condition, event get as well
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+                break
+        # Extraneous error handling
+        if not running:
             break
-    # Extraneous error handling
-    if not running:
-        break
-
-    # Construct action vector based on inputs
-    action = np.zeros(env.action_dim)
-
-    # If using controller, read controller inputs and apply deadzones
-    if found_controller:
-        left_stick_x = apply_deadzone(joystick.get_axis(0), deadzone)
-        left_stick_y = apply_deadzone(joystick.get_axis(1), deadzone)
-        right_stick_x = apply_deadzone(joystick.get_axis(3), deadzone)
-        right_stick_y = apply_deadzone(joystick.get_axis(4), deadzone)
-        left_trigger = apply_deadzone(1 + joystick.get_axis(2), deadzone)
-        right_trigger = (joystick.get_axis(5) + 1) / 2
-        button_A = joystick.get_button(Input.NOT_BOUND)               # A button
-        controls.demo_scrap = joystick.get_button(Input.SCRAP_DEMO)   # B button
-        controls.demo_toggle = joystick.get_button(Input.TOGGLE_DEMO) # X button
-        controls.demo_finish = joystick.get_button(Input.FINISH_DEMO) # Y button
-        left_bumper = joystick.get_button(4)  # Left Bumper
-        right_bumper = joystick.get_button(4) # Right Bumper
-        
-        controls.translate = (left_stick_y * arm_scaling, left_stick_x * arm_scaling, -(right_stick_y * wrist_scaling))
-        controls.wrist = (right_stick_x * rotation_scaling, (left_trigger * trigger_scaling) * (1 if left_bumper else -1))
-        grip = (actuator_info[gripper_id] - 0.55) / 5.45 # Should convert observed range 0.55-6.0 to 0.0-1.0
-        clamped = 1.0 if 1.0 < grip else 0.0 if grip < 0.0 else grip
-        grip_ctl = right_trigger - clamped
-        if right_trigger > 0.95:
-            controls.gripper = 1.0
-        elif abs(grip_ctl) >= 0.1: # Prevent erratic movement
-            if grip_ctl < 0:
-                controls.gripper = math.sin(5 * math.pi * grip_ctl / 9 + math.pi / 18)
-            else:
-                controls.gripper = math.sin(5 * math.pi * grip_ctl / 9 - math.pi / 18)
-
-
-    # Left joystick controls movement within plane parallel to ground (If robosuite >1.5, otherwise non-composite controller)
-    action[0] = controls.translate[0] # (Non-Composite: Base rotation)
-    action[1] = controls.translate[1] # (Non-Composite: Shoulder)
-    # Right joystick controls elevation and end effector left/right tilt (If robosuite >1.5, otherwise non-composite controller)
-    action[2] = controls.translate[2] # (Non-Composite: Elbow)
-    action[3] = controls.wrist[0]     # (Non-Composite: Wrist)
-    # Left trigger controls end effector forward/backward tilt, left bumper controls tilt direction
-    action[4] = controls.wrist[1]     # (Non-Composite: Wrist)
-    # Right trigger controls gripper
-    action[6] = controls.gripper
-
-    # Step the environment with the computed action
-    obs, reward, done, info = env.step(action)
-    
-    # Retrieve the end effector position from the observation
-    # Adjust the key if needed; typically "robot0_eef_pos" or "eef_pos"
-    eef_pos = obs.get("robot0_eef_pos", None)
-    if eef_pos is None:
-        eef_pos = obs.get("eef_pos", None)
-    if eef_pos is None:
-        raise ValueError("End-effector position not found in observation!")
-    
-    # Append the data for this timestep, if recording
-    if controls.demo_toggle:
-        if not button_held[Input.TOGGLE_DEMO]:
-            button_held[Input.TOGGLE_DEMO] = True
-            recording = not recording
-            start_time = time.time()
-            above_inplace(f"Recording {'started' if recording else 'ended'}")
-            attributes["grip_initial" if recording else "grip_final"] = controls.gripper == 1.0
-    elif button_held[Input.TOGGLE_DEMO]:
-        button_held[Input.TOGGLE_DEMO] = False
-    if recording:
-        actions.append(action)
-        eef_positions.append(eef_pos if position_offset is None else eef_pos + position_offset)
-        above_inplace(f"Current robot EE: {obs['robot0_eef_pos']}{'' if position_offset is None else f', Relative to object: {eef_pos + position_offset}'}")
-        timestamps.append(time.time() - start_time)
-        
-    # Render at the control frequency
-    current_time = time.time()
-    if current_time - last_render_time >= 1/20:
+
+        # Construct action vector based on inputs
+        action = np.zeros(env.action_dim)
+
+        # If using controller, read controller inputs and apply deadzones
+        if found_controller:
+            left_stick_x = apply_deadzone(joystick.get_axis(0), deadzone)
+            left_stick_y = apply_deadzone(joystick.get_axis(1), deadzone)
+            right_stick_x = apply_deadzone(joystick.get_axis(3), deadzone)
+            right_stick_y = apply_deadzone(joystick.get_axis(4), deadzone)
+            left_trigger = apply_deadzone(1 + joystick.get_axis(2), deadzone)
+            right_trigger = (joystick.get_axis(5) + 1) / 2
+            button_A = joystick.get_button(Input.NOT_BOUND)               # A button
+            controls.demo_scrap = joystick.get_button(Input.SCRAP_DEMO)   # B button
+            controls.demo_toggle = joystick.get_button(Input.TOGGLE_DEMO) # X button
+            controls.demo_finish = joystick.get_button(Input.FINISH_DEMO) # Y button
+            left_bumper = joystick.get_button(4)  # Left Bumper
+            right_bumper = joystick.get_button(4) # Right Bumper
+
+            controls.translate = (left_stick_y * arm_scaling, left_stick_x * arm_scaling, -(right_stick_y * wrist_scaling))
+            controls.wrist = (right_stick_x * rotation_scaling, (left_trigger * trigger_scaling) * (1 if left_bumper else -1))
+            grip = (actuator_info[gripper_id] - 0.55) / 5.45 # Should convert observed range 0.55-6.0 to 0.0-1.0
+            clamped = 1.0 if 1.0 < grip else 0.0 if grip < 0.0 else grip
+            grip_ctl = right_trigger - clamped
+            if right_trigger > 0.95:
+                controls.gripper = 1.0
+            elif abs(grip_ctl) >= 0.1: # Prevent erratic movement
+                if grip_ctl < 0:
+                    controls.gripper = math.sin(5 * math.pi * grip_ctl / 9 + math.pi / 18)
+                else:
+                    controls.gripper = math.sin(5 * math.pi * grip_ctl / 9 - math.pi / 18)
+
+
+        # Left joystick controls movement within plane parallel to ground (If robosuite >1.5, otherwise non-composite controller)
+        action[0] = controls.translate[0] # (Non-Composite: Base rotation)
+        action[1] = controls.translate[1] # (Non-Composite: Shoulder)
+        # Right joystick controls elevation and end effector left/right tilt (If robosuite >1.5, otherwise non-composite controller)
+        action[2] = controls.translate[2] # (Non-Composite: Elbow)
+        action[3] = controls.wrist[0]     # (Non-Composite: Wrist)
+        # Left trigger controls end effector forward/backward tilt, left bumper controls tilt direction
+        action[4] = controls.wrist[1]     # (Non-Composite: Wrist)
+        # Right trigger controls gripper
+        action[6] = controls.gripper
+
+        # Toggled before stepping, so the action of the tick recording starts on is the first one recorded
+        if controls.demo_toggle:
+            if not button_held[Input.TOGGLE_DEMO]:
+                button_held[Input.TOGGLE_DEMO] = True
+                if not recording and actions:
+                    # One initial state and one action sequence per demo: resuming would skip the unrecorded steps
+                    ui.post("Recording already ended, finish (Y) to save it or scrap (B) it")
+                else:
+                    recording = not recording
+                    if recording:
+                        # Kept so the recording can be replayed from the exact state its first action is applied to
+                        initial_state = env.sim.get_state().flatten()
+                        loop_lateness.clear()
+                        loop_overruns = 0
+                    ui.post(f"Recording {'started' if recording else 'ended'}")
+                    attributes["grip_initial" if recording else "grip_final"] = controls.gripper == 1.0
+        elif button_held[Input.TOGGLE_DEMO]:
+            button_held[Input.TOGGLE_DEMO] = False
+
+        # Step the environment with the computed action
+        obs, reward, done, info = env.step(action)
         env.render()
-        last_render_time = current_time
-    
-    # Print controller state at bottom of terminal
-    print_inplace(f"{controls}")
-    
-    if controls.demo_scrap:
-        if not button_held[Input.SCRAP_DEMO]:
-            button_held[Input.SCRAP_DEMO] = True
+
+        # Retrieve the end effector position from the observation
+        # Adjust the key if needed; typically "robot0_eef_pos" or "eef_pos"
+        eef_pos = obs.get("robot0_eef_pos", None)
+        if eef_pos is None:
+            eef_pos = obs.get("eef_pos", None)
+        if eef_pos is None:
+            raise ValueError("End-effector position not found in observation!")
+
+        # Append the data for this timestep, if recording
+        if recording:
+            actions.append(action)
+            eef_positions.append(eef_pos if position_offset is None else eef_pos + position_offset)
+            ui.status = f"Current robot EE: {obs['robot0_eef_pos']}{'' if position_offset is None else f', Relative to object: {eef_pos + position_offset}'}"
+            # The sim advances one control step per recorded sample, so stamps follow the sample index
+            timestamps.append(len(timestamps) * control_period)
+
+        # Controller state is printed at the bottom of the terminal by the UI thread
+        ui.controls = controls
+
+        if controls.demo_scrap:
+            if not button_held[Input.SCRAP_DEMO]:
+                button_held[Input.SCRAP_DEMO] = True
+                if recording or actions:
+                    recording = False
+                    ui.post("Recording scrapped, resetting...")
+                    actions.clear()
+                    eef_positions.clear()
+                    timestamps.clear()
+                    initial_state = None
+                    env.reset()
+                    env.visualize(vis_settings = { "robots": False, "grippers": True, "env": False })
+                    actuator_info = env.sim.data.qfrc_actuator
+                    gripper_id = env.sim.model.actuator_name2id('gripper0_right_finger_1')
+                    next_deadline = time.perf_counter()
+        elif button_held[Input.SCRAP_DEMO]:
+            button_held[Input.SCRAP_DEMO] = False
+
+        if controls.demo_finish:
+            done = True
+        if done:
+            ui.post("Episode complete")
+            running = False
+            break
+
+        # Sleep until the next deadline; after an overrun skip the missed deadlines instead of bursting
+        now = time.perf_counter()
+        if now > next_deadline:
+            missed = math.floor((now - next_deadline) / control_period) + 1
+            next_deadline += missed * control_period
             if recording:
-                recording = False
-                print(f"Recording scrapped, resetting...\n\n")
-                print_inplace.inplace_line_count = 0
-                actions.clear()
-                eef_positions.clear()
-                timestamps.clear()
-                start_time = time.time()
-                env.reset()
-                env.visualize(vis_settings = { "robots": False, "grippers": True, "env": False })
-                actuator_info = env.sim.data.qfrc_actuator
-                gripper_id = env.sim.model.actuator_name2id('gripper0_right_finger_1')
-    elif button_held[Input.SCRAP_DEMO]:
-        button_held[Input.SCRAP_DEMO] = False
-
-    if controls.demo_finish:
-        done = True
-    if done:
-        print("Episode complete")
-        running = False
-        obs = env.reset()
-
-print("Reached end, closing...")
-env.close()
-pygame.quit()
-
-# Determine next available file number in the demonstrations folder
-existing_files = os.listdir(folder_path)
-pattern = f"demo_{attributes['skill_name']}_" + r'(\d+)\.h5'
-max_num = 0
-for filename in existing_files:
-    m = re.match(pattern, filename)
-    if m:
-        num = int(m.group(1))
-        if num > max_num:
-            max_num = num
-new_file_num = max_num + 1
-new_file_name = f"demo_{attributes['skill_name']}_{new_file_num}.h5"
-full_path = os.path.join(folder_path, new_file_name)
-
-# Save the demonstration data to the new file
-with h5py.File(full_path, "w") as f:
-    print("Writing demonstration data...")
-    f.attrs.update(attributes)
-    f.attrs["env_name"] = "Lift"
-    f.attrs["robot"] = "UR5e"
-    f.attrs["control_freq"] = env.control_freq
-    f.create_dataset("timestamps", data=np.array(timestamps))
-    f.create_dataset("eef_positions", data=np.array(eef_positions))
-    f.create_dataset("actions", data=np.array(actions))
-
-print(f"Trajectory saved to {full_path}")
+                loop_overruns += 1
+        time.sleep(max(0.0, next_deadline - time.perf_counter()))
+        if recording:
+            loop_lateness.append(time.perf_counter() - next_deadline)
+        next_deadline += control_period
+
+    ui.stop()
+    print("Reached end, closing...")
+    env.close()
+    pygame.quit()
+
+    # Determine next available file number in the demonstrations folder
+    existing_files = os.listdir(folder_path)
+    pattern = f"demo_{attributes['skill_name']}_" + r'(\d+)\.h5'
+    max_num = 0
+    for filename in existing_files:
+        m = re.match(pattern, filename)
+        if m:
+            num = int(m.group(1))
+            if num > max_num:
+                max_num = num
+    new_file_num = max_num + 1
+    new_file_name = f"demo_{attributes['skill_name']}_{new_file_num}.h5"
+    full_path = os.path.join(folder_path, new_file_name)
+
+    # Save the demonstration data to the new file
+    with h5py.File(full_path, "w") as f:
+        print("Writing demonstration data...")
+        f.attrs.update(attributes)
+        f.attrs["env_name"] = "Lift"
+        f.attrs["robot"] = "UR5e"
+        f.attrs["control_freq"] = env.control_freq
+        f.attrs["loop_period"] = control_period
+        f.attrs["loop_ticks"] = len(timestamps)
+        f.attrs["loop_overruns"] = loop_overruns
+        if loop_lateness:
+            f.attrs["loop_jitter_mean"] = float(np.mean(loop_lateness))
+            f.attrs["loop_jitter_std"] = float(np.std(loop_lateness))
+            f.attrs["loop_jitter_max"] = float(np.max(loop_lateness))
+        f.create_dataset("timestamps", data=np.array(timestamps))
+        f.create_dataset("eef_positions", data=np.array(eef_positions))
+        f.create_dataset("actions", data=np.array(actions))
+        if initial_state is not None:
+            f.create_dataset("initial_state", data=initial_state)
+        if position_offset is not None:
+            f.create_dataset("position_offset", data=position_offset)
+
+    print(f"Trajectory saved to {full_path}")
+
+if __name__ == "__main__":
+    main()
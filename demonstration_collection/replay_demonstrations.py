@@ -0,0 +1,128 @@
+import sys
+sys.path.append('..')
+import os
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Headless environment, built once per worker process
+env = None
+
+def make_replay_env(control_freq):
+    import robosuite as suite
+    from robosuite.models.objects import BoxObject
+    from environments import pick_place_custom
+
+    # Same scene as collect_demonstration.py, without any rendering
+    box_r = BoxObject(
+        name="red",
+        size=[0.02, 0.02, 0.02],
+        rgba=[1, 0, 0, 1]
+    )
+    return suite.make(
+        env_name="PickPlaceCustom",
+        robots="UR5e",
+        has_renderer=False,
+        has_offscreen_renderer=False,
+        use_camera_obs=False,
+        control_freq=control_freq,
+        initialization_noise=None,
+        horizon=5000000,
+        ignore_done=True,
+        use_initializer=False,
+        blocks=[box_r],
+        observables=["robot0_eef_pos", "robot0_joint_pos", "robot0_gripper_qpos"]
+    )
+
+def replay_demonstration(filepath, tolerance=0.01, write=False, regenerate=False):
+    global env
+    import h5py
+    with h5py.File(filepath, "r") as f:
+        if "actions" not in f.keys() or len(f["actions"]) == 0:
+            return { "file": filepath, "status": "skipped (no actions)" }
+        control_freq = int(f.attrs.get("control_freq", 20))
+        actions = np.array(f["actions"])
+        recorded = np.array(f["eef_positions"])
+        initial_state = np.array(f["initial_state"]) if "initial_state" in f.keys() else None
+        position_offset = np.array(f["position_offset"]) if "position_offset" in f.keys() else None
+
+    if env is None or env.control_freq != control_freq:
+        env = make_replay_env(control_freq)
+    env.reset()
+    if initial_state is not None:
+        env.sim.set_state_from_flattened(initial_state)
+        env.sim.forward()
+
+    blocks = env.blocks if isinstance(env.blocks, list) else [env.blocks]
+
+    T = len(actions)
+    eef_positions = np.zeros((T, 3))
+    joint_positions = np.zeros((T, len(env.robots[0].joint_indexes)))
+    gripper_qpos = None
+    object_positions = np.zeros((T, len(blocks), 3))
+    object_quats = np.zeros((T, len(blocks), 4))
+    for i, action in enumerate(actions):
+        obs, _, _, _ = env.step(action)
+        eef_positions[i] = obs["robot0_eef_pos"]
+        joint_positions[i] = obs["robot0_joint_pos"]
+        if gripper_qpos is None:
+            gripper_qpos = np.zeros((T, len(obs["robot0_gripper_qpos"])))
+        gripper_qpos[i] = obs["robot0_gripper_qpos"]
+        env.block_positions(out=object_positions[i])
+        env.block_quats(out=object_quats[i])
+
+    if position_offset is not None:
+        eef_positions += position_offset
+    # Older demos don't store the state recording started from, so their replay starts from
+    # the reset pose and can't be compared against (or replace) the recorded trace
+    if initial_state is None:
+        status = "unverifiable (no initial_state)"
+        regenerate = False
+    max_error = float(np.max(np.linalg.norm(eef_positions - recorded, axis=1))) if len(recorded) == T else float("nan")
+    valid = bool(initial_state is not None and max_error < tolerance)
+    if initial_state is not None:
+        status = "valid" if valid else "mismatch"
+
+    if write:
+        with h5py.File(filepath, "a") as f:
+            for name, data in (("joint_positions", joint_positions),
+                               ("gripper_qpos", gripper_qpos),
+                               ("object_positions", object_positions),
+                               ("object_quats", object_quats)):
+                if name in f.keys():
+                    del f[name]
+                f.create_dataset(name, data=data)
+            if regenerate:
+                del f["eef_positions"]
+                f.create_dataset("eef_positions", data=eef_positions)
+            f.attrs["replay_max_error"] = max_error
+            f.attrs["replay_valid"] = valid
+
+    return { "file": filepath, "status": status, "steps": T, "max_error": max_error }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded actions in headless environments")
+    parser.add_argument("--demos", default="demonstrations", help="Folder of raw demonstrations")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Max end-effector deviation (m) for a valid replay")
+    parser.add_argument("--write", action="store_true", help="Write the extracted observations back into the demo files")
+    parser.add_argument("--regenerate", action="store_true", help="Also replace eef_positions with the replayed trace (implies --write)")
+    args = parser.parse_args(argv)
+
+    files = [os.path.join(args.demos, f) for f in sorted(os.listdir(args.demos)) if f.endswith('.h5')]
+    if not files:
+        print("No demonstrations available...")
+        sys.exit()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(replay_demonstration, filepath, args.tolerance, args.write or args.regenerate, args.regenerate)
+                   for filepath in files]
+        for future in as_completed(futures):
+            result = future.result()
+            if "max_error" in result:
+                print(f"{result['file']}: {result['status']} ({result['steps']} steps, max error {result['max_error']:.5f})")
+            else:
+                print(f"{result['file']}: {result['status']}")
+
+if __name__ == "__main__":
+    main()
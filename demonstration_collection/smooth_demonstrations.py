@@ -1,11 +1,10 @@
 import os
-import h5py
 import numpy as np
-from scipy.interpolate import interp1d
 
 # Smooth the trajectory using cubic interpolation.
 # def smooth_trajectory(data, num_samples=200, kind='cubic'):
 def smooth_trajectory(data, num_samples=50, kind='cubic'):
+    from scipy.interpolate import interp1d
     n_timesteps, n_features = data.shape if data.ndim > 1 else (data.shape[0], 1)
     # Create a normalized time vector for the raw data.
     original_t = np.linspace(0, 1, n_timesteps)
@@ -24,24 +23,16 @@ def smooth_trajectory(data, num_samples=50, kind='cubic'):
     
     return smoothed
 
-raw_demo_folder = "demonstrations"
-smoothed_demo_folder = "smoothed_demonstrations"
-
-if not os.path.exists(smoothed_demo_folder):
-    os.makedirs(smoothed_demo_folder)
-files = [f for f in os.listdir(raw_demo_folder) if f.endswith('.h5')]
-
-num_samples = 50 # Number of samples on curve
-
-for filename in files:
-    raw_file_path = os.path.join(raw_demo_folder, filename)
+# Smooths a single raw demonstration file, returns False if it was skipped
+def smooth_demonstration_file(raw_file_path, smoothed_file_path, num_samples=50):
+    import h5py
     attrs = {}
-    
+
     # Open the raw demonstration file.
     with h5py.File(raw_file_path, "r") as f:
         if "skill_name" not in f.attrs.keys():
             print(f"Skipping demos from {raw_file_path} due to missing attributes!")
-            continue
+            return False
         attrs.update(f.attrs)
         raw_timestamps = np.array(f["timestamps"])
         raw_positions = np.array(f["eef_positions"])
@@ -50,14 +41,29 @@ for filename in files:
     smoothed_positions = smooth_trajectory(raw_positions, num_samples=num_samples, kind='cubic')
     # Interpolate timestamps to match the new number of samples.
     smoothed_timestamps = np.linspace(raw_timestamps[0], raw_timestamps[-1], num_samples)
-    
-    new_filename = "smoothed_" + filename
-    smoothed_file_path = os.path.join(smoothed_demo_folder, new_filename)
-    
+
     with h5py.File(smoothed_file_path, "w") as f:
         f.attrs.update(attrs)
         f.create_dataset("timestamps", data=smoothed_timestamps)
         f.create_dataset("eef_positions", data=smoothed_positions)
-    
+
     print(f"Saved smoothed demonstration: {smoothed_file_path}")
+    return True
+
+def main():
+    raw_demo_folder = "demonstrations"
+    smoothed_demo_folder = "smoothed_demonstrations"
+
+    if not os.path.exists(smoothed_demo_folder):
+        os.makedirs(smoothed_demo_folder)
+    files = [f for f in os.listdir(raw_demo_folder) if f.endswith('.h5')]
+
+    num_samples = 50 # Number of samples on curve
+
+    for filename in files:
+        raw_file_path = os.path.join(raw_demo_folder, filename)
+        smoothed_file_path = os.path.join(smoothed_demo_folder, "smoothed_" + filename)
+        smooth_demonstration_file(raw_file_path, smoothed_file_path, num_samples=num_samples)
 
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from robosuite.utils.observables import Observable, sensor # probably
 from robosuite.utils.placement_samplers import UniformRandomSampler
 from robosuite.utils.transform_utils import convert_quat # probably
 from .arenas.sort_arena import SortArena
+from .placement import VectorizedPlacementSampler, PlacementPool
 import numpy as np
 
 class PickPlaceCustom(ManipulationEnv):
@@ -42,7 +43,12 @@ class PickPlaceCustom(ManipulationEnv):
         # Custom Stuff
         use_initializer=True,
         obj_initializer=None,
-        blocks=None
+        blocks=None,
+        fast_reset=False,
+        settle_steps=20,
+        placement_pool_dir=None,
+        placement_pool_size=10000,
+        observables=None
     ):
         # Set up default block if necessary
         if blocks is None:
@@ -79,6 +85,23 @@ class PickPlaceCustom(ManipulationEnv):
                 self.obj_initializer = obj_initializer
                 # Add blocks to initializer
                 self.obj_initializer.mujoco_objects.add_objects(self.blocks)
+        # Only these observables are computed every step, None keeps all of them
+        self.minimal_observables = None if observables is None else set(observables)
+        # Fast reset restores a settled snapshot instead of rebuilding the model every episode
+        self.fast_reset = fast_reset
+        self.settle_steps = settle_steps
+        self._settled_state = None
+        self._placement_rng = np.random.default_rng(seed)
+        if self.fast_reset:
+            hard_reset = False
+        # Placement pool hands out precomputed layouts by episode seed instead of sampling
+        self.placement_pool = None
+        self.episode_seed = 0 if seed is None else seed
+        if self.fast_reset or placement_pool_dir is not None:
+            blocks_list = self.blocks if isinstance(self.blocks, list) else [self.blocks]
+            self.placement_sampler = VectorizedPlacementSampler(blocks_list)
+            if placement_pool_dir is not None:
+                self.placement_pool = PlacementPool.load_or_build(self.placement_sampler, placement_pool_dir, placement_pool_size)
         super().__init__(
             robots=robots,
             env_configuration=env_configuration,
@@ -122,11 +145,83 @@ class PickPlaceCustom(ManipulationEnv):
             mujoco_objects=self.blocks
         )
     
+    def _setup_references(self):
+        super()._setup_references()
+        # Cached ids for the direct position accessors
+        robot = self.robots[0]
+        self._eef_site_id = robot.eef_site_id[robot.arms[0]]
+        blocks_list = self.blocks if isinstance(self.blocks, list) else [self.blocks]
+        self._block_body_ids = np.array([self.sim.model.body_name2id(block.root_body) for block in blocks_list])
+        self._block_index = { block.name: i for i, block in enumerate(blocks_list) }
+
+    def _setup_observables(self):
+        observables = super()._setup_observables()
+        if self.minimal_observables is not None:
+            for name, observable in observables.items():
+                if name not in self.minimal_observables:
+                    observable.set_enabled(False)
+                    observable.set_active(False)
+        return observables
+
+    def eef_position(self, out=None):
+        """
+        End-effector position read straight from sim.data. Without out this is a view that
+        changes as the simulation steps; with out it is copied into the given (3,) array.
+        """
+        if out is None:
+            return self.sim.data.site_xpos[self._eef_site_id]
+        np.copyto(out, self.sim.data.site_xpos[self._eef_site_id])
+        return out
+
+    def block_positions(self, out=None):
+        """
+        (n_blocks, 3) block positions, in the order the blocks were given, copied into out if provided.
+        """
+        return np.take(self.sim.data.body_xpos, self._block_body_ids, axis=0, out=out)
+
+    def block_quats(self, out=None):
+        return np.take(self.sim.data.body_xquat, self._block_body_ids, axis=0, out=out)
+
+    def block_position(self, name, out=None):
+        """
+        Position of the block with the given name (e.g. "red"), a view into sim.data unless out is given.
+        """
+        body_id = self._block_body_ids[self._block_index[name]]
+        if out is None:
+            return self.sim.data.body_xpos[body_id]
+        np.copyto(out, self.sim.data.body_xpos[body_id])
+        return out
+
+    def reset(self):
+        obs = super().reset()
+        if self.fast_reset and self._settled_state is None:
+            # Let everything settle once, later resets start from this state
+            for _ in range(self.settle_steps):
+                obs, _, _, _ = self.step(np.zeros(self.action_dim))
+            self._settled_state = self.sim.get_state()
+        return obs
+
+    def _place_blocks(self):
+        if self.placement_pool is not None:
+            positions, quats = self.placement_pool.get(self.episode_seed)
+            self.episode_seed += 1
+        else:
+            positions, quats = self.placement_sampler.sample(self._placement_rng)
+        for block, pos, quat in zip(self.placement_sampler.blocks, positions, quats):
+            self.sim.data.set_joint_qpos(block.joints[0], np.concatenate([pos, quat]))
+            self.sim.data.set_joint_qvel(block.joints[0], np.zeros(6))
+
     def _reset_internal(self):
         super()._reset_internal()
         
-        if not self.deterministic_reset:
-            if self.use_initializer:
+        if self.fast_reset and self._settled_state is not None:
+            self.sim.set_state(self._settled_state)
+            if self.use_initializer and not self.deterministic_reset:
+                self._place_blocks()
+        elif not self.deterministic_reset:
+            if self.use_initializer and self.placement_pool is not None:
+                self._place_blocks()
+            elif self.use_initializer:
                 placements = self.obj_initializer.sample()
                 for pos, quat, block in placements.values():
                     self.sim.data.set_joint_qpos(block.joints[0], np.concatenate([np.array(pos), np.array(quat)]))
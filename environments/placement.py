@@ -0,0 +1,112 @@
+import os
+import numpy as np
+
+class VectorizedPlacementSampler:
+    """
+    Samples collision-free block layouts resting on the table, testing a whole batch of
+    candidate layouts at once with pairwise distance checks instead of placing the blocks
+    one by one with rejection.
+    """
+    def __init__(self, blocks, x_range=(-0.08, 0.08), y_range=(-0.08, 0.08), reference_pos=(0, 0, 0.8),
+                 rotation_axis='z', batch_size=256):
+        self.blocks = blocks
+        self.x_range = x_range
+        self.y_range = y_range
+        self.reference_pos = np.array(reference_pos)
+        self.rotation_axis = rotation_axis
+        self.batch_size = batch_size
+        self.radii = np.array([block.horizontal_radius for block in blocks])
+        # Blocks are placed resting on the table so no settling is needed
+        self.heights = np.array([self.reference_pos[2] - block.bottom_offset[2] for block in blocks])
+        self.min_distance = self.radii[:, None] + self.radii[None, :]
+
+    def valid_layouts(self, xy):
+        """
+        :param xy: (B, n_blocks, 2) candidate block positions.
+        :return: (B,) mask of layouts where no two blocks overlap.
+        """
+        diff = xy[:, :, None, :] - xy[:, None, :, :]
+        dist = np.sqrt(np.sum(diff ** 2, axis=-1))
+        np.einsum('bii->bi', dist)[:] = np.inf
+        return np.all(dist >= self.min_distance, axis=(1, 2))
+
+    def sample_batch(self, rng, batch_size=None):
+        """
+        :return: (positions, quats) of the valid layouts in one batch of candidates, with shapes
+            (B', n_blocks, 3) and (B', n_blocks, 4), quaternions in (w, x, y, z) order.
+        """
+        batch_size = self.batch_size if batch_size is None else batch_size
+        n = len(self.blocks)
+        xy = np.stack((rng.uniform(*self.x_range, size=(batch_size, n)),
+                       rng.uniform(*self.y_range, size=(batch_size, n))), axis=-1)
+        xy = xy[self.valid_layouts(xy)]
+
+        positions = np.empty((xy.shape[0], n, 3))
+        positions[:, :, :2] = xy + self.reference_pos[:2]
+        positions[:, :, 2] = self.heights
+
+        angles = rng.uniform(0, 2 * np.pi, size=(xy.shape[0], n))
+        quats = np.zeros((xy.shape[0], n, 4))
+        quats[:, :, 0] = np.cos(angles / 2)
+        quats[:, :, "xyz".index(self.rotation_axis) + 1] = np.sin(angles / 2)
+        return positions, quats
+
+    def sample(self, rng, max_batches=100):
+        """
+        :return: (positions, quats) of a single valid layout, shapes (n_blocks, 3) and (n_blocks, 4).
+        """
+        for _ in range(max_batches):
+            positions, quats = self.sample_batch(rng)
+            if len(positions) > 0:
+                return positions[0], quats[0]
+        raise RuntimeError(f"Could not find a valid placement for {len(self.blocks)} blocks")
+
+class PlacementPool:
+    """
+    Precomputed collision-free layouts for a fixed set of blocks, stored on disk per block
+    count so every reset is a lookup and an episode seed always maps to the same layout.
+    """
+    def __init__(self, positions, quats):
+        self.positions = positions
+        self.quats = quats
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, seed):
+        idx = seed % len(self)
+        return self.positions[idx], self.quats[idx]
+
+    @staticmethod
+    def config(sampler):
+        return np.concatenate((sampler.radii, sampler.heights, sampler.x_range, sampler.y_range, sampler.reference_pos))
+
+    @classmethod
+    def build(cls, sampler, size, seed=0):
+        rng = np.random.default_rng(seed)
+        positions, quats = [], []
+        count = 0
+        while count < size:
+            batch_positions, batch_quats = sampler.sample_batch(rng)
+            positions.append(batch_positions)
+            quats.append(batch_quats)
+            count += len(batch_positions)
+        return cls(np.concatenate(positions)[:size], np.concatenate(quats)[:size])
+
+    @classmethod
+    def load_or_build(cls, sampler, folder_path, size=10000, seed=0):
+        """
+        Load the pool for this number of blocks, rebuilding it if it is missing, too small or
+        was generated for different block sizes or ranges.
+        """
+        path = os.path.join(folder_path, f"placement_pool_{len(sampler.blocks)}_blocks.npz")
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if len(data["positions"]) >= size and np.array_equal(data["config"], cls.config(sampler)):
+                    return cls(data["positions"][:size], data["quats"][:size])
+        pool = cls.build(sampler, size, seed)
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        np.savez(path, positions=pool.positions, quats=pool.quats, config=cls.config(sampler))
+        print(f"Placement pool saved to {path}")
+        return pool
@@ -0,0 +1,128 @@
+import time
+import threading
+import numpy as np
+
+RENDER_MODES = ("every", "threaded", "none")
+
+class RenderPolicy(object):
+    """
+    Wraps an environment so rendering follows a policy instead of every env.render() call the
+    control loop makes. Everything else is forwarded to the wrapped environment.
+    """
+    def __init__(self, env):
+        self.env = env
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    def step(self, action):
+        with self.lock:
+            return self.env.step(action)
+
+    def reset(self):
+        with self.lock:
+            return self.env.reset()
+
+    def render(self):
+        pass
+
+    def visualize(self, vis_settings):
+        # Changes geom colors in the model, so it is kept out of a running step or frame copy
+        with self.lock:
+            return self.env.visualize(vis_settings)
+
+    def close(self):
+        self.env.close()
+
+class EveryNthRender(RenderPolicy):
+    """
+    Renders on every Nth render() call, i.e. every Nth control step.
+    """
+    def __init__(self, env, every=1):
+        super().__init__(env)
+        self.every = max(1, every)
+        self._calls = 0
+
+    def render(self):
+        self._calls += 1
+        if self._calls >= self.every:
+            self._calls = 0
+            self.env.render()
+
+class ThreadedRender(RenderPolicy):
+    """
+    Renders from a side thread at a capped frame rate. Each frame only holds the step lock while
+    it copies the simulation state into a render-side MjData; the kinematics and the viewer sync
+    run on that copy outside the lock, so the control loop never waits for the viewer.
+    """
+    def __init__(self, env, fps=30.0):
+        super().__init__(env)
+        self.period = 1.0 / fps
+        self._model = None
+        self._data = None
+        self._viewer = None
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _snapshot(self):
+        # Called under the step lock: only plain array copies happen here
+        import mujoco
+        model, data = self.env.sim.model._model, self.env.sim.data._data
+        if model is not self._model:
+            # A hard reset rebuilds the model, the render-side copy and viewer follow it
+            if self._viewer is not None:
+                self._viewer.close()
+                self._viewer = None
+            self._model = model
+            self._data = mujoco.MjData(model)
+        self._data.time = data.time
+        np.copyto(self._data.qpos, data.qpos)
+        np.copyto(self._data.qvel, data.qvel)
+        np.copyto(self._data.act, data.act)
+        np.copyto(self._data.mocap_pos, data.mocap_pos)
+        np.copyto(self._data.mocap_quat, data.mocap_quat)
+
+    def _draw(self):
+        import mujoco
+        import mujoco.viewer
+        mujoco.mj_forward(self._model, self._data)
+        if self._viewer is None:
+            self._viewer = mujoco.viewer.launch_passive(self._model, self._data, show_left_ui=False, show_right_ui=False)
+        self._viewer.sync()
+
+    def _run(self):
+        next_frame = time.perf_counter()
+        while self._running:
+            with self.lock:
+                self._snapshot()
+            self._draw()
+            next_frame += self.period
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        if self._viewer is not None:
+            self._viewer.close()
+        self.env.close()
+
+def with_rendering(env, mode="every", every=1, fps=30.0):
+    """
+    :param mode: "every" renders every Nth step on the control thread, "threaded" renders from a
+        side thread at fps, "none" never renders.
+    """
+    if mode == "every":
+        return EveryNthRender(env, every)
+    if mode == "threaded":
+        return ThreadedRender(env, fps)
+    if mode == "none":
+        return RenderPolicy(env)
+    raise ValueError(f"Unknown render mode {mode!r}, expected one of {RENDER_MODES}")
+
+def add_render_arguments(parser, mode="every", every=1, fps=30.0):
+    parser.add_argument("--render", choices=RENDER_MODES, default=mode,
+                        help="Render every Nth step, from a side thread at a capped frame rate, or not at all")
+    parser.add_argument("--render-every", type=int, default=every, help="Steps between frames in 'every' mode")
+    parser.add_argument("--render-fps", type=float, default=fps, help="Frame rate cap in 'threaded' mode")
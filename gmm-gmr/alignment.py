@@ -0,0 +1,70 @@
+import os
+import hashlib
+import numpy as np
+from utils import align_to_reference, dtw_barycenter_average
+
+def demo_key(demo):
+    # Content hash, so renamed or re-read demonstrations still hit the cache
+    return hashlib.sha1(np.ascontiguousarray(demo, dtype=np.float64).tobytes()).hexdigest()
+
+class AlignmentCache(object):
+    """
+    Per-skill DTW alignment template with the demonstrations already aligned to it. Only demos
+    the cache has not seen are aligned, and the template is rebuilt only when the demos drift
+    away from it.
+    """
+    def __init__(self, path):
+        """
+        :param path: npz file the template and the aligned demonstrations are kept in.
+        """
+        self.path = path
+        self.template = None
+        self.spread = None
+        self.entries = {}
+        if os.path.isfile(path):
+            with np.load(path) as f:
+                self.template = f["template"]
+                self.spread = float(f["spread"])
+                self.entries = { key: (aligned, float(cost))
+                                 for key, aligned, cost in zip(f["keys"], f["aligned"], f["costs"]) }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = list(self.entries.keys())
+        np.savez(self.path, template=self.template, spread=self.spread, keys=np.array(keys),
+                 aligned=np.array([self.entries[k][0] for k in keys]), costs=np.array([self.entries[k][1] for k in keys]))
+
+    def _rebuild(self, demos, keys, initial, n_iterations):
+        self.template = dtw_barycenter_average(demos, initial, n_iterations)
+        self.entries = {}
+        for key, demo in zip(keys, demos):
+            self.entries[key] = align_to_reference(self.template, demo, return_cost=True)
+        self.spread = float(np.mean([cost for _, cost in self.entries.values()]))
+
+    def align(self, demos, drift_threshold=0.25, n_iterations=10):
+        """
+        :param demos: List of (T_i, D) demonstrations of one skill.
+        :param drift_threshold: Relative increase of the mean alignment cost over the cost the
+            template was built with, above which the template is rebuilt.
+        :return: (N, T, D) aligned demonstrations in the order given, and a report dict.
+        """
+        keys = [demo_key(demo) for demo in demos]
+        report = { "aligned": 0, "drift": 0.0, "refreshed": False }
+        if self.template is None:
+            # Start from the longest demonstration, the reference align_trajectories uses
+            self._rebuild(demos, keys, demos[int(np.argmax([len(d) for d in demos]))], n_iterations)
+            report.update(aligned=len(demos), refreshed=True)
+        else:
+            for key, demo in zip(keys, demos):
+                if key not in self.entries:
+                    self.entries[key] = align_to_reference(self.template, demo, return_cost=True)
+                    report["aligned"] += 1
+            cost = np.mean([self.entries[key][1] for key in keys])
+            report["drift"] = float(cost / max(self.spread, 1e-12) - 1.0)
+            if report["drift"] > drift_threshold:
+                self._rebuild(demos, keys, self.template, n_iterations)
+                report.update(aligned=len(demos), refreshed=True)
+        # Demos that are no longer in the corpus are dropped from the cache
+        self.entries = { key: self.entries[key] for key in keys }
+        self.save()
+        return np.array([self.entries[key][0] for key in keys]), report
@@ -1,31 +1,31 @@
 import sys
 sys.path.append('..')
 import time
-import h5py
 import numpy as np
-import robosuite as suite
-from robosuite.models.objects import BoxObject
-from environments import pick_place_custom
 import os
-import sys
+import argparse
+from waypoints import acceptance_thresholds, simplify_trajectory, variance_tolerances
+from environments.rendering import add_render_arguments, with_rendering
 
 def load_skill_from_h5(file_path):
+    import h5py
     with h5py.File(file_path, "r") as f:
         times = np.array(f["times"])
         trajectory = np.array(f["trajectory"])
         grip_strength = np.array(f["grip_strength"])
+        covariances = np.array(f["covariances"]) if "covariances" in f.keys() else None
         print(f"Loaded skill from: {file_path}")
         print(f"Trajectory shape: {trajectory.shape}")
         print(f"Gripper Strength shape: {grip_strength.shape}")
-    return times, trajectory, grip_strength
+    return times, trajectory, grip_strength, covariances
 
 #  Incrementally moves the robot toward the target using delta commands
 def move_to_target(env, target, grip_strength_target, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02, max_steps=100):
     fixed_orientation = np.zeros(3)
     
     action_zero = np.zeros(env.action_dim)
-    obs, _, _, _ = env.step(action_zero)
-    current = np.array(obs["robot0_eef_pos"])
+    env.step(action_zero)
+    current = env.eef_position().copy()
     
     step = 0
     while step < max_steps:
@@ -45,16 +45,29 @@ def move_to_target(env, target, grip_strength_target, control_interval=0.1, scal
 
         # action = np.concatenate((delta, fixed_orientation, [grip_strength_target]))
         
-        obs, _, _, _ = env.step(action)
-        current = np.array(obs["robot0_eef_pos"])
+        env.step(action)
+        current = env.eef_position().copy()
         env.render()
         time.sleep(control_interval) 
         step += 1
     else:
         print("Max steps reached without converging to the target.")
 
-def apply_skill_trajectory(skill_file, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02):
-    times, trajectory, grip_strength = load_skill_from_h5(skill_file)
+def apply_skill_trajectory(skill_file, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02, waypoint_tolerance=0.005,
+                           render="every", render_every=1, render_fps=30.0):
+    times, trajectory, grip_strength, covariances = load_skill_from_h5(skill_file)
+    if covariances is None:
+        thresholds = np.full(len(trajectory), acceptance_threshold)
+        tolerances = waypoint_tolerance
+    else:
+        thresholds = acceptance_thresholds(covariances)
+        # Simplify within a variance-scaled tolerance of the mean, as the waypoints export_skill saves
+        tolerances = variance_tolerances(covariances)
+
+    # The simulator is only imported once we know it is needed
+    import robosuite as suite
+    from robosuite.models.objects import BoxObject
+    from environments import pick_place_custom
     
     # Create cubes
     box_r = BoxObject(
@@ -81,16 +94,19 @@ def apply_skill_trajectory(skill_file, control_interval=0.1, scaling=1.0, accept
     env = suite.make(
         env_name="PickPlaceCustom",
         robots="UR5e",
-        has_renderer=True,
+        has_renderer=render != "none",
         has_offscreen_renderer=False,
         use_camera_obs=False,
         control_freq=20,
         controller_configs=controller_config,
         use_initializer=True,
-        blocks=[box_r, box_g, box_b]
+        blocks=[box_r, box_g, box_b],
+        # Positions are read through env.eef_position(), so no observable needs to be computed
+        observables=[]
     )
+    env = with_rendering(env, render, render_every, render_fps)
     
-    obs = env.reset()
+    env.reset()
     env.render()
     time.sleep(1.0)
     
@@ -104,11 +120,15 @@ def apply_skill_trajectory(skill_file, control_interval=0.1, scaling=1.0, accept
 
     time.sleep(3.0)
     
-    # Iterate through the trajectory points
-    for i, point in enumerate(trajectory):
+    # Iterate through the simplified trajectory, keeping every point where the grip changes
+    grip_changes = np.flatnonzero(np.diff(np.ravel(grip_strength)[:len(trajectory)])) + 1
+    waypoint_indices = np.union1d(simplify_trajectory(trajectory, tolerances), grip_changes)
+    print(f"Visiting {len(waypoint_indices)} of {len(trajectory)} trajectory points")
+    for i in waypoint_indices:
+        point = trajectory[i]
         print(f"Moving to trajectory point {i}: {point}")
         print(f"Gripper Strength {i}: {grip_strength[i]}")
-        move_to_target(env, point, grip_strength[i], control_interval, scaling, acceptance_threshold)
+        move_to_target(env, point, grip_strength[i], control_interval, scaling, thresholds[i])
     
     # Stay at last position of trajectory
     print("Reached final position.")
@@ -122,11 +142,19 @@ def apply_skill_trajectory(skill_file, control_interval=0.1, scaling=1.0, accept
     time.sleep(2)
     env.close()
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a single learned skill")
+    add_render_arguments(parser)
+    args = parser.parse_args(argv)
+
     skills_dir = "skills"
     if not os.path.exists(skills_dir):
         print("No skills available...")
         sys.exit()
 
     skill_file_path = os.path.join(skills_dir, "skill_1.h5")
-    apply_skill_trajectory(skill_file_path, control_interval=0.1, scaling=5.0, acceptance_threshold=0.05)
+    apply_skill_trajectory(skill_file_path, control_interval=0.1, scaling=5.0, acceptance_threshold=0.05,
+                           render=args.render, render_every=args.render_every, render_fps=args.render_fps)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,24 @@
-import re
+import io
 import sys
 sys.path.append('..')
 import time
-import h5py
+import argparse
+import contextlib
 import numpy as np
-import robosuite as suite
-from robosuite.models.objects import BoxObject
-from environments import pick_place_custom
-from environments.pick_place_custom import PickPlaceCustom
+from concurrent.futures import ProcessPoolExecutor
 import os
-import sys
 from skill import Skill
+from lookup_table import LookupTable
+from instrumentation import NULL_PROFILER, TickProfiler
+from environments.rendering import add_render_arguments, with_rendering
+from checkpoints import checkpoint_path, load_checkpoint, restore_checkpoint, save_checkpoint
+from motion_plan import blend_indices, hermite_transition, sample_velocities, skill_samples
+from waypoints import acceptance_thresholds, simplify_trajectory, variance_tolerances
+from planner import missing_skills, problem_objects, solve
 
 
-def build_skill_library(skills_directory):
+def build_skill_library(skills_directory, waypoint_tolerance=0.005):
+    import h5py
     skills = {}
     for filename in sorted(os.listdir(skills_directory)):
         if filename.endswith('.h5'):
@@ -30,9 +35,19 @@ def build_skill_library(skills_directory):
                     continue
                 times = np.array(f["times"])
                 trajectory = np.array(f["trajectory"])
-                skills[skill_name] = Skill(times, trajectory, attrs)
+                retimed_times = np.array(f["retimed_times"]) if "retimed_times" in f.keys() else None
+                retimed_trajectory = np.array(f["retimed_trajectory"]) if "retimed_trajectory" in f.keys() else None
+                covariances = np.array(f["covariances"]) if "covariances" in f.keys() else None
+                if "waypoint_indices" in f.keys():
+                    waypoint_indices = np.array(f["waypoint_indices"])
+                else:
+                    # Skills saved before simplification existed are simplified on load
+                    tolerances = variance_tolerances(covariances) if covariances is not None else waypoint_tolerance
+                    waypoint_indices = simplify_trajectory(trajectory, tolerances)
+                skills[skill_name] = Skill(times, trajectory, attrs, retimed_times, retimed_trajectory, waypoint_indices,
+                                           covariances, LookupTable.from_h5(f))
                 print(f"Loaded skill from: {skill_path}")
-                print(f"Trajectory shape: {trajectory.shape}")
+                print(f"Trajectory shape: {trajectory.shape}, {len(waypoint_indices)} waypoints")
     return skills
 
 def adjust_trajectory(trajectory, target_position):
@@ -43,38 +58,68 @@ def adjust_trajectory(trajectory, target_position):
     """
     return trajectory + target_position
 
-def move_to_target(env, target, grip_strength, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02, max_steps=100):
+def move_to_target(env, target, grip_strength, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02, max_steps=100,
+                   profiler=NULL_PROFILER):
     fixed_orientation = np.zeros(3)
     action_zero = np.zeros(env.action_dim)
     action_zero[6] = grip_strength
-    obs, _, _, _ = env.step(action_zero)
-    current = np.array(obs["robot0_eef_pos"])
+    env.step(action_zero)
+    current = env.eef_position().copy()
     
     step = 0
     while step < max_steps:
+        profiler.start_tick()
         error = target - current
         err_norm = np.linalg.norm(error)
         if err_norm < acceptance_threshold:
             break
         delta = scaling * error
         action = np.concatenate((delta, fixed_orientation, np.array([grip_strength])))
-        obs, _, _, _ = env.step(action)
-        current = np.array(obs["robot0_eef_pos"])
+        profiler.mark("compute")
+        env.step(action)
+        profiler.mark("step")
+        current = env.eef_position().copy()
+        profiler.mark("compute")
         env.render()
+        profiler.mark("render")
         time.sleep(control_interval)
+        profiler.mark("sleep")
+        profiler.end_tick()
         step += 1
     else:
         print("Max steps reached without converging to the target.")
+    profiler.record_convergence(step, step < max_steps)
+
+# Follows a retimed trajectory, taking one sample per control step instead of converging on each
+def track_trajectory(env, samples, grip_strength, control_interval=0.05, scaling=1.0, current=None, profiler=NULL_PROFILER):
+    fixed_orientation = np.zeros(3)
+    if current is None:
+        action_zero = np.zeros(env.action_dim)
+        action_zero[6] = grip_strength
+        env.step(action_zero)
+        current = env.eef_position().copy()
+
+    for point in samples:
+        profiler.start_tick()
+        delta = scaling * (point - current)
+        action = np.concatenate((delta, fixed_orientation, np.array([grip_strength])))
+        profiler.mark("compute")
+        env.step(action)
+        profiler.mark("step")
+        current = env.eef_position().copy()
+        profiler.mark("compute")
+        env.render()
+        profiler.mark("render")
+        time.sleep(control_interval)
+        profiler.mark("sleep")
+        profiler.end_tick()
+    return current
 
 # Gets the block position 
 def get_target_position(env, target):
     if target is None:
         return None
-    candidates = [b for b in env.sim.model.body_names if b.startswith(target + "_")]
-    if len(candidates) != 1:
-        raise ValueError(f"Expected exactly one body for {target}, got {candidates!r}")
-    body_id = env.sim.model.body_name2id(candidates[0])
-    return env.sim.data.body_xpos[body_id].copy()
+    return env.block_position(target).copy()
 
 # Set the block position TODO: make this for every block that spawns in (semi random configuration of 3 blocks)
 def set_object_position(env, object_name, new_position):
@@ -89,9 +134,18 @@ def set_object_position(env, object_name, new_position):
     env.sim.forward()
     print(f"Manually set {object_name} to {new_position}")
 
-def apply_skill_trajectory(skill, target, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02):
+def apply_skill_trajectory(env, skill, target, control_interval=0.1, scaling=1.0, acceptance_threshold=0.02, retimed=True,
+                           variance_thresholds=True, profiler=NULL_PROFILER):
     # Load the learned skill
     times, trajectory = skill.trajectory_data()
+    _, waypoints = skill.waypoint_data()
+
+    # Per-waypoint thresholds from the GMR covariance, or the global threshold everywhere
+    waypoint_covariances = skill.waypoint_covariances() if variance_thresholds else None
+    if waypoint_covariances is None:
+        thresholds = np.full(len(waypoints), acceptance_threshold)
+    else:
+        thresholds = acceptance_thresholds(waypoint_covariances)
 
     print(f"\n\nApplying skill \'{skill.name()}\' on target \'{'self' if target is None else target}\'\n\n")
     
@@ -105,15 +159,26 @@ def apply_skill_trajectory(skill, target, control_interval=0.1, scaling=1.0, acc
     grip = 1.0 if skill.grip_initial() else -1.0  # Adjust as needed for your gripper configuration
     print("Moving to starting position:", starting_point)
     print("Starting Gripper Strength:", grip)
-    move_to_target(env, starting_point, grip, control_interval, scaling, acceptance_threshold=0.01)
+    move_to_target(env, starting_point, grip, control_interval, scaling, acceptance_threshold=0.01, profiler=profiler)
 
     time.sleep(3.0)
     
-    # Iterate through the waypoints of the adjusted trajectory
-    for i, point in enumerate(adjusted_trajectory):
-        print(f"Moving to trajectory point {i}: {point}")
-        print(f"Gripper Strength {i}: {grip}")
-        move_to_target(env, point, grip, control_interval, scaling, acceptance_threshold)
+    retimed_data = skill.retimed_trajectory_data() if retimed else None
+    if retimed_data is not None:
+        # Time-optimal samples, one per control step, then settle on the final point
+        retimed_times, retimed_trajectory = retimed_data
+        samples = retimed_trajectory if target_position is None else adjust_trajectory(retimed_trajectory, target_position)
+        dt = retimed_times[1] - retimed_times[0] if len(retimed_times) > 1 else control_interval
+        print(f"Tracking retimed trajectory: {len(samples)} samples over {retimed_times[-1]:.2f}s")
+        track_trajectory(env, samples, grip, dt, scaling, profiler=profiler)
+        move_to_target(env, samples[-1], grip, control_interval, scaling, thresholds[-1], profiler=profiler)
+    else:
+        # Iterate through the simplified waypoints of the adjusted trajectory
+        adjusted_waypoints = waypoints if target_position is None else adjust_trajectory(waypoints, target_position)
+        for i, point in enumerate(adjusted_waypoints):
+            print(f"Moving to trajectory point {i}: {point}")
+            print(f"Gripper Strength {i}: {grip}, threshold {thresholds[i]:.3f}")
+            move_to_target(env, point, grip, control_interval, scaling, thresholds[i], profiler=profiler)
     
     # Hold the last position
     print("Reached final position.")
@@ -124,22 +189,90 @@ def apply_skill_trajectory(skill, target, control_interval=0.1, scaling=1.0, acc
         env.render()
         time.sleep(control_interval)
 
-if __name__ == "__main__":
-    skills_dir = "skills"
-    if not os.path.exists(skills_dir):
-        print("No skills available...")
-        sys.exit()
+def execute_plan(env, plan, control_interval=0.05, scaling=1.0, acceptance_threshold=0.02, blend_steps=10, grip_steps=10,
+                 v_max=0.5, a_max=1.0, variance_thresholds=True, profiler=NULL_PROFILER, start_index=0, start_state=None,
+                 on_action_done=None, realtime=True):
+    """
+    Executes a sequence of (skill, target) pairs as one continuous motion. The tail of each skill
+    is blended into the head of the next with a transition that matches the GMR velocities at both
+    ends; the arm only stops where the gripper has to open or close.
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(base_dir)
-    task_file = os.path.join(project_root, "tasks", "stack", "task01.pddl")
-    solution_file = task_file + ".soln"
+    :param start_index: Index of the first action to execute, when resuming a plan.
+    :param start_state: Executor state (grip, position, velocity) saved when the plan was interrupted.
+    :param on_action_done: Called as on_action_done(n_done, state) after each action, e.g. to checkpoint.
+    :param realtime: Sleep for the control period after every step, off for headless runs.
+    :return: The executor state (grip, position, velocity) after the last action, as on_action_done gets it.
+    """
+    state = start_state
+    if start_state is None:
+        grip = 1.0 if plan[start_index][0].grip_initial() else -1.0
+        current = None
+        position, velocity = None, np.zeros(3)
+    else:
+        grip = float(start_state["grip"])
+        current = np.array(env.eef_position())
+        position, velocity = np.array(start_state["position"]), np.array(start_state["velocity"])
+    sleep = control_interval if realtime else 0.0
+
+    for i in range(start_index, len(plan)):
+        skill, target = plan[i]
+        print(f"\n\nApplying skill \'{skill.name()}\' on target \'{'self' if target is None else target}\'\n\n")
+
+        # The target is read when the skill is reached, after the previous skills moved the blocks
+        target_position = get_target_position(env, target)
+        samples = skill_samples(skill, target_position, control_interval, v_max, a_max)
+        velocities = sample_velocities(samples, control_interval)
+        skill_grip = 1.0 if skill.grip_initial() else -1.0
+        final_grip = 1.0 if skill.grip_final() else -1.0
+        grip_change_before = skill_grip != grip
+        grip_change_after = final_grip != skill_grip or i == len(plan) - 1
+        entry, exit_ = blend_indices(len(samples), blend_steps, grip_change_before, grip_change_after)
+
+        if current is None:
+            action_zero = np.zeros(env.action_dim)
+            action_zero[6] = grip
+            env.step(action_zero)
+            current = env.eef_position().copy()
+            position = current
+
+        # Transition from where the previous skill was left, stopping only if the gripper acts first
+        entry_velocity = np.zeros(3) if grip_change_before else velocities[entry]
+        transition = hermite_transition(position, velocity, samples[entry], entry_velocity, control_interval, v_max)
+        current = track_trajectory(env, transition, grip, sleep, scaling, current, profiler)
+        if grip_change_before:
+            grip = skill_grip
+            current = track_trajectory(env, [samples[entry]] * grip_steps, grip, sleep, scaling, current, profiler)
+
+        current = track_trajectory(env, samples[entry + 1:exit_ + 1], grip, sleep, scaling, current, profiler)
+        position, velocity = samples[exit_], velocities[exit_]
+
+        if grip_change_after:
+            # Grasp and release points are reached exactly before the gripper acts
+            covariances = skill.waypoint_covariances() if variance_thresholds else None
+            threshold = acceptance_threshold if covariances is None else acceptance_thresholds(covariances)[-1]
+            move_to_target(env, position, grip, sleep, scaling, threshold, profiler=profiler)
+            grip = final_grip
+            current = track_trajectory(env, [position] * grip_steps, grip, sleep, scaling, profiler=profiler)
+            velocity = np.zeros(3)
+
+        state = { "grip": grip, "position": position, "velocity": velocity }
+        if on_action_done is not None:
+            on_action_done(i + 1, state)
+    return state
+
+def read_block_colors(task_file):
+    # dynamically populate the environment with the blocks declared in the problem file
+    return problem_objects(task_file, "block")
 
-    # dynamically populate the environment depending on the expected blocks in the solution file
-    pattern = r"\s+((?:\w+\s)+).*\s*-\s+block"
-    with open(task_file) as f:
-        colors = re.findall(pattern, f.read(), re.S)[0].strip().split()
+def read_commands(solution_file):
+    with open(solution_file, "r") as f:
+        return [line.strip() for line in f if line.strip()]
 
+def make_env(colors, render="every", render_every=1, render_fps=30.0):
+    # The simulator is only imported once we know it is needed
+    import robosuite as suite
+    from robosuite.models.objects import BoxObject
+    from environments import pick_place_custom
 
     RGBA = {
         "red":    [1.0, 0.0, 0.0, 1.0],
@@ -158,49 +291,179 @@ if __name__ == "__main__":
     env = suite.make(
         env_name="PickPlaceCustom",
         robots="UR5e",
-        has_renderer=True,
+        has_renderer=render != "none",
         has_offscreen_renderer=False,
         use_camera_obs=False,
         control_freq=20,
         ignore_done=True,
         controller_configs=controller_config,
         use_initializer=True,
-        blocks=blocks
+        blocks=blocks,
+        fast_reset=True,
+        # Positions are read through env.eef_position(), so no observable needs to be computed
+        observables=[]
     )
-    obs = env.reset()
-    env.render()
-    time.sleep(2.0)
+    # Rendering follows the chosen policy, the executors' env.render() calls only request frames
+    env = with_rendering(env, render, render_every, render_fps)
+    # Objects settle inside the first reset, later resets restore the settled snapshot
+    env.reset()
+    return env
 
-    # Allow objects to settle before running
-    for _ in range(20):
-        _, _, _, _ = env.step(np.zeros(env.action_dim))
-        env.render()
-        time.sleep(0.1)
+def build_plan(skill_library, commands):
+    """
+    :return: The commands that have a skill, and the matching (skill, target) pairs.
+    """
+    planned, plan = [], []
+    for cmd in commands:
+        parts = cmd.strip("()").split()
+        if parts[0] not in skill_library.keys():
+            print(f"No skill found for PDDL command \'{cmd}\', skipping.")
+            continue
 
+        skill = skill_library[parts[0]]
+        planned.append(cmd)
+        plan.append((skill, skill.get_target(parts[1:])))
+    return planned, plan
 
-    skill_library = build_skill_library(skills_dir)
+def run_branch(checkpoint_file, solution_file, skills_dir, output_dir):
+    """
+    Continues a checkpointed plan headless with the commands of another solution file and saves
+    the final state. Runs in a worker process, so it builds its own environment.
+    """
+    checkpoint = load_checkpoint(checkpoint_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = make_env(read_block_colors(checkpoint["task_file"]), render="none")
+        restore_checkpoint(env, checkpoint)
+        commands, plan = build_plan(build_skill_library(skills_dir), read_commands(solution_file))
+        executor_state = checkpoint["executor"]
+        if plan:
+            # The grip, position and velocity the continuation ended with, not the ones it started from
+            executor_state = execute_plan(env, plan, control_interval=1.0 / env.control_freq, scaling=5.0,
+                                          start_state=checkpoint["executor"], realtime=False)
+    name = os.path.splitext(os.path.basename(solution_file))[0]
+    output = save_checkpoint(os.path.join(output_dir, f"branch_{name}.npz"), env, checkpoint["task_file"],
+                             checkpoint["commands"][:checkpoint["plan_index"]] + commands,
+                             checkpoint["plan_index"] + len(commands), executor_state)
+    blocks = { block: env.block_position(block).copy() for block in read_block_colors(checkpoint["task_file"]) }
+    env.close()
+    return { "solution": solution_file, "checkpoint": output, "blocks": blocks }
 
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(base_dir)
+
+    parser = argparse.ArgumentParser(description="Execute a PDDL plan with the learned skills")
+    parser.add_argument("--task", default=os.path.join(project_root, "tasks", "stack", "task01.pddl"))
+    parser.add_argument("--skills", default="skills")
+    parser.add_argument("--list-skills", action="store_true", help="Print the skill library and exit without starting the simulator")
+    parser.add_argument("--fixed-threshold", action="store_true", help="Use one acceptance threshold for every waypoint instead of the GMR covariance")
+    parser.add_argument("--no-blending", action="store_true", help="Run each skill separately, moving to its start and pausing in between")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="LOG",
+                        help="Time every control tick, print a live summary and save a binary tick log (default profiles/ticks_<time>.npz)")
+    add_render_arguments(parser)
+    parser.add_argument("--checkpoints", default=None, metavar="DIR", help="Save a checkpoint after every action to DIR")
+    parser.add_argument("--resume", default=None, metavar="CHECKPOINT", help="Continue an interrupted plan from a checkpoint")
+    parser.add_argument("--branch", default=None, metavar="CHECKPOINT",
+                        help="Run the --continuations solution files in parallel from a checkpoint, headless")
+    parser.add_argument("--continuations", nargs="+", default=[], help="Solution files to continue with in --branch mode")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel branches in --branch mode")
+    parser.add_argument("--no-retiming", action="store_true", help="Converge on every GMR waypoint instead of tracking the retimed trajectory")
+    parser.add_argument("--plan", action="store_true", help="Plan the task in-process even if a .soln file exists")
+    parser.add_argument("--plan-cache", default="plan_cache", help="Folder for plans cached by domain and problem hash")
+    args = parser.parse_args(argv)
 
-    # Using planner for picking block TODO: make this better pathing wise and in general all the code
-    if not os.path.isfile(solution_file):
-        print(f"Solution file not found: {solution_file}")
+    skills_dir = args.skills
+    if not os.path.exists(skills_dir):
+        print("No skills available...")
         sys.exit()
 
-    # read the solution commands
-    with open(solution_file, "r") as f:
-        commands = [line.strip() for line in f if line.strip()]
+    if args.list_skills:
+        for name, skill in build_skill_library(skills_dir).items():
+            print(f"{name}: grip {skill.grip_initial()} -> {skill.grip_final()}")
+        return
 
-    for cmd in commands:
-        parts = cmd.strip("()").split()
-        if parts[0] not in skill_library.keys():
-            print(f"No skill found for PDDL command \'{cmd}\', skipping.")
-            continue
+    if args.branch is not None:
+        # What-if continuations from one saved state, each in its own headless simulator
+        output_dir = os.path.dirname(args.branch) or "."
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(run_branch, args.branch, soln, skills_dir, output_dir) for soln in args.continuations]
+            for future in futures:
+                result = future.result()
+                print(f"Branch {result['solution']} -> {result['checkpoint']}")
+                for block, position in result["blocks"].items():
+                    print(f"  {block}: {np.round(position, 3)}")
+        return
 
-        skill = skill_library[parts[0]]
-        target = skill.get_target(parts[1:])
+    checkpoint = None
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        task_file = checkpoint["task_file"]
+        commands = checkpoint["commands"]
+        print(f"Resuming {task_file} after {checkpoint['plan_index']} of {len(commands)} actions")
+    else:
+        task_file = os.path.abspath(args.task)
+        solution_file = task_file + ".soln"
+
+        if os.path.isfile(solution_file) and not args.plan:
+            # read the solution commands
+            commands = read_commands(solution_file)
+        else:
+            # No pre-generated solution, plan in-process
+            try:
+                commands = solve(task_file, cache_dir=args.plan_cache)
+            except (OSError, ValueError) as e:
+                print(f"Planning failed: {e}")
+                sys.exit()
+            print(f"Planned {len(commands)} actions for {task_file}")
+
+    skill_library = build_skill_library(skills_dir)
+    missing = missing_skills(commands, skill_library)
+    if missing:
+        print(f"No skill learned for PDDL actions {missing}, available: {sorted(skill_library.keys())}")
+        sys.exit()
+
+    env = make_env(read_block_colors(task_file), args.render, args.render_every, args.render_fps)
+    if checkpoint is not None:
+        restore_checkpoint(env, checkpoint)
+    env.render()
+    time.sleep(2.0)
+
+    commands, plan = build_plan(skill_library, commands)
+
+    if args.checkpoints is not None:
+        os.makedirs(args.checkpoints, exist_ok=True)
+        def on_action_done(n_done, state):
+            path = save_checkpoint(checkpoint_path(args.checkpoints, n_done), env, task_file, commands, n_done, state)
+            print(f"Checkpoint saved to {path}")
+    else:
+        on_action_done = None
 
-        # perform the pick‑and‑place skill
-        apply_skill_trajectory(skill, target, control_interval=0.1, scaling=5.0, acceptance_threshold=0.02)
+    profiler = NULL_PROFILER if args.profile is None else TickProfiler(budget=1.0 / env.control_freq, live_every=2.0)
+
+    start_index = 0 if checkpoint is None else checkpoint["plan_index"]
+    if not args.no_blending and not args.no_retiming and start_index < len(plan):
+        # The whole plan as one continuous motion, one sample per control step
+        execute_plan(env, plan, control_interval=1.0 / env.control_freq, scaling=5.0, acceptance_threshold=0.02,
+                     variance_thresholds=not args.fixed_threshold, profiler=profiler, start_index=start_index,
+                     start_state=None if checkpoint is None else checkpoint["executor"], on_action_done=on_action_done)
+    else:
+        for i in range(start_index, len(plan)):
+            skill, target = plan[i]
+            # perform the pick‑and‑place skill
+            apply_skill_trajectory(env, skill, target, control_interval=0.1, scaling=5.0, acceptance_threshold=0.02,
+                                   retimed=not args.no_retiming, variance_thresholds=not args.fixed_threshold,
+                                   profiler=profiler)
+            if on_action_done is not None:
+                grip = 1.0 if skill.grip_final() else -1.0
+                on_action_done(i + 1, { "grip": grip, "position": env.eef_position().copy(), "velocity": np.zeros(3) })
+
+    if args.profile is not None:
+        print(profiler.summary())
+        log_path = args.profile
+        if not log_path:
+            os.makedirs("profiles", exist_ok=True)
+            log_path = os.path.join("profiles", f"ticks_{int(time.time())}.npz")
+        profiler.save(log_path)
 
     # Hold for a few seconds before closing
     for _ in range(20):
@@ -210,3 +473,5 @@ if __name__ == "__main__":
 
     env.close()
 
+if __name__ == "__main__":
+    main()
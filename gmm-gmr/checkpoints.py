@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+# Controller attributes that carry state from one step to the next
+CONTROLLER_ATTRIBUTES = ("goal_pos", "goal_ori", "goal_qpos", "goal_vel", "goal_torque", "relative_ori", "ori_ref",
+                         "current_action")
+
+def part_controllers(env):
+    controller = env.robots[0].composite_controller
+    return getattr(controller, "part_controllers", {})
+
+def controller_state(env):
+    state = {}
+    for part, controller in part_controllers(env).items():
+        for attribute in CONTROLLER_ATTRIBUTES:
+            value = getattr(controller, attribute, None)
+            if isinstance(value, np.ndarray):
+                state[f"controller/{part}/{attribute}"] = value.copy()
+    return state
+
+def save_checkpoint(path, env, task_file, commands, plan_index, executor_state):
+    """
+    Snapshot of the simulator, the controllers and the plan progress.
+
+    :param task_file: PDDL problem the environment was built for.
+    :param commands: Every PDDL command of the plan.
+    :param plan_index: Number of commands already executed.
+    :param executor_state: Dict of arrays the executor needs to continue (grip, position, velocity).
+    """
+    arrays = {
+        "sim_state": env.sim.get_state().flatten(),
+        "ctrl": env.sim.data.ctrl.copy(),
+        "task_file": np.array(task_file),
+        "commands": np.array(commands),
+        "plan_index": np.array(plan_index),
+    }
+    arrays.update(controller_state(env))
+    arrays.update({ f"executor/{name}": np.asarray(value) for name, value in executor_state.items() })
+    np.savez_compressed(path, **arrays)
+    return path
+
+def load_checkpoint(path):
+    with np.load(path) as f:
+        data = { name: f[name] for name in f.files }
+    return {
+        "sim_state": data["sim_state"],
+        "ctrl": data["ctrl"],
+        "task_file": str(data["task_file"]),
+        "commands": [str(c) for c in data["commands"]],
+        "plan_index": int(data["plan_index"]),
+        "controller": { name: value for name, value in data.items() if name.startswith("controller/") },
+        "executor": { name[len("executor/"):]: value for name, value in data.items() if name.startswith("executor/") },
+    }
+
+def restore_checkpoint(env, checkpoint):
+    env.sim.set_state_from_flattened(checkpoint["sim_state"])
+    env.sim.data.ctrl[:] = checkpoint["ctrl"]
+    env.sim.forward()
+    controllers = part_controllers(env)
+    for name, value in checkpoint["controller"].items():
+        _, part, attribute = name.split("/")
+        if part in controllers:
+            setattr(controllers[part], attribute, value.copy())
+    # Controllers cache the robot state they act on, refresh it from the restored sim
+    for controller in controllers.values():
+        if hasattr(controller, "update"):
+            controller.update(force=True)
+
+def checkpoint_path(folder, plan_index):
+    return os.path.join(folder, f"checkpoint_{plan_index:03d}.npz")
@@ -0,0 +1,107 @@
+import io
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+def _open_in_memory(filepath):
+    import h5py
+    # h5py serializes every call behind one global lock, so the pool only overlaps the plain file
+    # reads, which release the GIL; h5py then parses the file from memory
+    with open(filepath, 'rb') as f:
+        return h5py.File(io.BytesIO(f.read()), 'r')
+
+def _read_header(filepath, dataset_key):
+    with _open_in_memory(filepath) as f:
+        attrs = dict(f.attrs)
+        if "skill_name" not in attrs.keys() or dataset_key not in f.keys():
+            return filepath, None, 0
+        return filepath, attrs, f[dataset_key].shape[0]
+
+def scan_corpus(folder_path, dataset_key='eef_positions', workers=8):
+    """
+    Builds the skill -> files map from the file attributes only, reading the files in parallel.
+
+    :return: { skill_name: { "attrs": attrs of the first file, "files": [...], "lengths": [...] } }
+    """
+    filepaths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith('.h5')]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        headers = list(executor.map(lambda p: _read_header(p, dataset_key), filepaths))
+
+    skill_files = {}
+    for filepath, attrs, length in headers:
+        if attrs is None:
+            print(f"Skipping demos from {filepath} due to missing attributes!")
+            continue
+        skill_name = attrs["skill_name"]
+        if skill_name in skill_files.keys():
+            skill_files[skill_name]["files"].append(filepath)
+            skill_files[skill_name]["lengths"].append(length)
+        else:
+            skill_files[skill_name] = { "attrs": attrs, "files": [filepath], "lengths": [length] }
+    return skill_files
+
+def _read_downsampled(filepath, length, dataset_key, n_points):
+    step = max(1, length // n_points)
+    with _open_in_memory(filepath) as f:
+        data = np.array(f[dataset_key][::step])
+    if data.ndim < 2:
+        data = data.reshape(-1, 1)
+    if dataset_key == 'states':
+        data = data[:, 1:4]
+    # Resample to exactly n_points so every pair of demos can be compared point by point
+    source = np.linspace(0.0, 1.0, len(data))
+    target = np.linspace(0.0, 1.0, n_points)
+    return np.stack([np.interp(target, source, data[:, j]) for j in range(data.shape[1])], axis=1)
+
+def outlier_scores(downsampled):
+    """
+    :param downsampled: (N, n_points, D) demos resampled to a common length.
+    :return: (N,) robust z-scores of each demo's median distance to the other demos.
+    """
+    diff = downsampled[:, None] - downsampled[None]
+    distances = np.mean(np.linalg.norm(diff, axis=3), axis=2)
+    n = len(downsampled)
+    # Median over the others, leaving out the zero distance to itself
+    others = distances[~np.eye(n, dtype=bool)].reshape(n, n - 1)
+    typical = np.median(others, axis=1)
+    center = np.median(typical)
+    mad = np.median(np.abs(typical - center))
+    return 0.6745 * (typical - center) / max(mad, 1e-12)
+
+def reject_outliers(skill_files, dataset_key='eef_positions', threshold=3.5, n_points=20, quarantine_dir=None, workers=8):
+    """
+    Scores every demo against the other demos of its skill and drops those with a robust
+    z-score above threshold (only on the high side, demos far from the others).
+
+    :param skill_files: Map returned by scan_corpus.
+    :param quarantine_dir: Outliers are moved here when given, so later runs skip them too.
+    :return: The map without the outliers, and the list of rejected files.
+    """
+    rejected = []
+    kept_files = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for skill_name, entry in skill_files.items():
+            files, lengths = entry["files"], entry["lengths"]
+            if len(files) < 4:
+                # Too few demos for a meaningful spread
+                kept_files[skill_name] = entry
+                continue
+            downsampled = np.array(list(executor.map(lambda a: _read_downsampled(a[0], a[1], dataset_key, n_points),
+                                                     zip(files, lengths))))
+            scores = outlier_scores(downsampled)
+            keep = scores <= threshold
+            for filepath, score, k in zip(files, scores, keep):
+                if k:
+                    continue
+                print(f"Outlier in '{skill_name}': {filepath} (score {score:.1f})")
+                rejected.append(filepath)
+            kept_files[skill_name] = dict(entry, files=[f for f, k in zip(files, keep) if k],
+                                          lengths=[l for l, k in zip(lengths, keep) if k])
+
+    if quarantine_dir is not None and rejected:
+        os.makedirs(quarantine_dir, exist_ok=True)
+        for filepath in rejected:
+            shutil.move(filepath, os.path.join(quarantine_dir, os.path.basename(filepath)))
+        print(f"Moved {len(rejected)} outliers to {quarantine_dir}")
+    return kept_files, rejected
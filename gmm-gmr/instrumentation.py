@@ -0,0 +1,142 @@
+import time
+import bisect
+import numpy as np
+
+PHASES = ("step", "render", "compute", "sleep")
+# Running histograms cover every phase and the total work per tick, log spaced from 10 us to 1 s
+HISTOGRAM_NAMES = PHASES + ("work",)
+HISTOGRAM_EDGES = np.logspace(-5, 0, 26)
+
+TICK_DTYPE = np.dtype([("start", "f8")] + [(phase, "f4") for phase in PHASES] + [("overrun", "?")])
+CONVERGENCE_DTYPE = np.dtype([("tick", "u4"), ("steps", "u2"), ("converged", "?")])
+
+class TickProfiler(object):
+    """
+    Per-tick timing of an executor control loop. The loop calls start_tick(), then mark(phase)
+    after each part of the tick (the time since the previous mark is charged to that phase) and
+    end_tick(). A tick overruns when its work, everything but the sleep, exceeds the control
+    period budget.
+    """
+    def __init__(self, budget=0.05, live_every=None):
+        """
+        :param budget: Control period (seconds).
+        :param live_every: Print a one line summary every this many seconds, None to stay quiet.
+        """
+        self.budget = budget
+        self.live_every = live_every
+        self._ticks = []
+        self._convergence = []
+        self._current = None
+        self._last = None
+        self._last_live = time.perf_counter()
+        # Running aggregates, so live summaries never rebuild the tick array
+        self._edges = list(HISTOGRAM_EDGES)
+        self._counts = np.zeros((len(HISTOGRAM_NAMES), len(HISTOGRAM_EDGES) - 1), dtype=np.int64)
+        self._sums = [0.0] * len(HISTOGRAM_NAMES)
+        self._overruns = 0
+
+    def start_tick(self):
+        self._last = time.perf_counter()
+        self._current = [self._last, 0.0, 0.0, 0.0, 0.0]
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._current[1 + PHASES.index(phase)] += now - self._last
+        self._last = now
+
+    def end_tick(self):
+        tick = self._current
+        work = tick[1] + tick[2] + tick[3]
+        self._ticks.append(tuple(tick) + (work > self.budget,))
+        self._current = None
+        self._overruns += work > self.budget
+        last_bin = len(self._edges) - 2
+        for row, value in enumerate(tick[1:] + [work]):
+            # Values outside the edges are counted in the first or last bin
+            self._counts[row, min(max(bisect.bisect_right(self._edges, value) - 1, 0), last_bin)] += 1
+            self._sums[row] += value
+        if self.live_every is not None and self._last - self._last_live >= self.live_every:
+            self._last_live = self._last
+            print(self.live_summary())
+
+    def record_convergence(self, steps, converged):
+        # Steps move_to_target needed for one waypoint
+        self._convergence.append((len(self._ticks), steps, converged))
+
+    def ticks(self):
+        return np.array(self._ticks, dtype=TICK_DTYPE)
+
+    def convergence(self):
+        return np.array(self._convergence, dtype=CONVERGENCE_DTYPE)
+
+    def _histogram_percentile(self, name, q):
+        # Upper edge of the running histogram bin holding the q-th percentile
+        counts = self._counts[HISTOGRAM_NAMES.index(name)]
+        i = int(np.searchsorted(np.cumsum(counts), q / 100.0 * len(self._ticks)))
+        return self._edges[min(i, len(counts) - 1) + 1]
+
+    def live_summary(self):
+        n = len(self._ticks)
+        if n == 0:
+            return "no ticks"
+        step, render = self._sums[PHASES.index("step")] / n, self._sums[PHASES.index("render")] / n
+        return (f"ticks {n} | work p50 <{self._histogram_percentile('work', 50) * 1000:.2g} ms"
+                f" p99 <{self._histogram_percentile('work', 99) * 1000:.2g} ms"
+                f" | step {step * 1000:.1f} ms render {render * 1000:.1f} ms | overruns {self._overruns}")
+
+    def histograms(self, bins=None):
+        """
+        :param bins: Bin edges in seconds, None for the running histograms (HISTOGRAM_EDGES, values
+            outside the edges counted in the first or last bin).
+        :return: A dict of phase -> (counts, edges), including the total work per tick.
+        """
+        if bins is None:
+            return { name: (self._counts[row].copy(), HISTOGRAM_EDGES) for row, name in enumerate(HISTOGRAM_NAMES) }
+        ticks = self.ticks()
+        values = { phase: ticks[phase] for phase in PHASES }
+        values["work"] = ticks["step"] + ticks["render"] + ticks["compute"]
+        return { name: np.histogram(v, bins=bins) for name, v in values.items() }
+
+    def summary(self):
+        ticks = self.ticks()
+        lines = [f"{len(ticks)} ticks, budget {self.budget * 1000:.1f} ms, {int(np.sum(ticks['overrun']))} overruns"]
+        if len(ticks) > 0:
+            lines.append(f"{'phase':8s} {'mean':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} (ms)")
+            values = { phase: ticks[phase] for phase in PHASES }
+            values["work"] = ticks["step"] + ticks["render"] + ticks["compute"]
+            for name, v in values.items():
+                p50, p95, p99 = np.percentile(v, [50, 95, 99]) * 1000
+                lines.append(f"{name:8s} {np.mean(v) * 1000:8.2f} {p50:8.2f} {p95:8.2f} {p99:8.2f} {np.max(v) * 1000:8.2f}")
+        convergence = self.convergence()
+        if len(convergence) > 0:
+            lines.append(f"{len(convergence)} waypoints, steps to convergence mean {np.mean(convergence['steps']):.1f}"
+                         f" max {np.max(convergence['steps'])}, {int(np.sum(~convergence['converged']))} not converged")
+        return "\n".join(lines)
+
+    def save(self, path):
+        """
+        Dump the raw ticks, the convergence records and the per-phase histograms as a compact binary
+        log (npz of structured arrays).
+        """
+        histograms = { f"histogram_{name}": counts for name, (counts, _) in self.histograms().items() }
+        np.savez_compressed(path, ticks=self.ticks(), convergence=self.convergence(), budget=self.budget,
+                            histogram_edges=HISTOGRAM_EDGES, **histograms)
+        print(f"Tick log saved to {path}")
+
+class NullProfiler(object):
+    """
+    Stand-in used when instrumentation is off, so executors can call the profiler unconditionally.
+    """
+    def start_tick(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_tick(self):
+        pass
+
+    def record_convergence(self, steps, converged):
+        pass
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,121 @@
+import numpy as np
+
+class LookupTable(object):
+    """
+    GMR skill compiled to evenly spaced samples of the mean, its time derivative and the
+    covariance. Queries interpolate the mean with a cubic Hermite spline and the covariance
+    linearly, in constant time and without any mixture or sklearn code.
+    """
+    def __init__(self, t_start, dt, means, derivatives, covariances, max_sampled_error=None):
+        """
+        :param t_start: Time of the first sample (seconds).
+        :param dt: Spacing of the samples (seconds).
+        :param means: (N, D) GMR means.
+        :param derivatives: (N, D) time derivatives of the GMR means.
+        :param covariances: (N, D, D) GMR covariances.
+        :param max_sampled_error: Largest mean error against the exact GMR over the dense check
+            compile_lookup_table runs, see there for how close it is to the true maximum.
+        """
+        self.t_start = t_start
+        self.dt = dt
+        self.means = means
+        self.derivatives = derivatives
+        self.covariances = covariances
+        self.max_sampled_error = max_sampled_error
+        self.t_end = t_start + dt * (len(means) - 1)
+
+    def _locate(self, times):
+        # Interval index and normalized position inside it, clamped to the table range
+        u = (np.clip(times, self.t_start, self.t_end) - self.t_start) / self.dt
+        i = np.minimum(np.floor(u).astype(int), len(self.means) - 2)
+        return i, u - i
+
+    def mean(self, times):
+        """
+        :param times: Scalar or (T,) query times.
+        :return: (D,) or (T, D) interpolated GMR means.
+        """
+        if np.ndim(times) == 0:
+            # Scalar fast path for control loops, plain float arithmetic on the basis
+            u = (min(max(float(times), self.t_start), self.t_end) - self.t_start) / self.dt
+            i = min(int(u), len(self.means) - 2)
+            s = u - i
+            s2, s3 = s * s, s * s * s
+            return ((2 * s3 - 3 * s2 + 1) * self.means[i] + (s3 - 2 * s2 + s) * self.dt * self.derivatives[i]
+                    + (3 * s2 - 2 * s3) * self.means[i + 1] + (s3 - s2) * self.dt * self.derivatives[i + 1])
+        i, s = self._locate(np.asarray(times, dtype=float))
+        s = s[..., None]
+        h00 = 2 * s ** 3 - 3 * s ** 2 + 1
+        h10 = s ** 3 - 2 * s ** 2 + s
+        h01 = -2 * s ** 3 + 3 * s ** 2
+        h11 = s ** 3 - s ** 2
+        return (h00 * self.means[i] + h10 * self.dt * self.derivatives[i]
+                + h01 * self.means[i + 1] + h11 * self.dt * self.derivatives[i + 1])
+
+    def covariance(self, times):
+        i, s = self._locate(np.asarray(times, dtype=float))
+        s = s[..., None, None]
+        return (1 - s) * self.covariances[i] + s * self.covariances[i + 1]
+
+    def datasets(self):
+        return { "lookup_means": self.means, "lookup_derivatives": self.derivatives, "lookup_covariances": self.covariances }
+
+    def attrs(self):
+        return { "lookup_t_start": self.t_start, "lookup_dt": self.dt, "lookup_max_sampled_error": self.max_sampled_error }
+
+    @classmethod
+    def from_h5(cls, f):
+        """
+        Reads the table saved with a skill, or returns None if the skill was saved without one.
+        """
+        if "lookup_means" not in f.keys():
+            return None
+        return cls(float(f.attrs["lookup_t_start"]), float(f.attrs["lookup_dt"]), np.array(f["lookup_means"]),
+                   np.array(f["lookup_derivatives"]), np.array(f["lookup_covariances"]),
+                   float(f.attrs["lookup_max_sampled_error"]))
+
+def compile_lookup_table(gmm_gmr, tolerance=1e-4, t_start=None, t_end=None, n_intervals=64, max_intervals=16384,
+                         check_points=16):
+    """
+    Compile a fitted GMM_GMR into a LookupTable. The number of samples is doubled until the
+    interpolated mean stays within tolerance of the exact GMR at check_points - 1 evenly spaced
+    points inside every interval. On an interval of length h the cubic Hermite error is
+    h^4 s^2 (1 - s)^2 / 24 times the fourth derivative of the mean somewhere in the interval.
+    Once that derivative is close to constant over an interval, the error peaks at the midpoint,
+    which is a check point for even check_points, and the check points next to it see at least
+    97% of the peak with the default 16. The stored maximum is the true one up to that margin.
+
+    :param tolerance: Maximum allowed mean error in the trajectory units.
+    :param t_start: First query time, defaults to the earliest gaussian center as in generate_trajectory.
+    :param t_end: Last query time, defaults to the latest gaussian center.
+    :param check_points: The interval is checked at multiples of 1 / check_points of its length.
+    :return: The table, with max_sampled_error set to the largest error found on the check points.
+    :raises ValueError: If the tolerance is still not met with max_intervals intervals.
+    """
+    t_start = min(gmm_gmr.centers_temporal) if t_start is None else t_start
+    t_end = max(gmm_gmr.centers_temporal) if t_end is None else t_end
+    W = gmm_gmr.pca.components_
+
+    def exact_means(times):
+        latent = np.array([np.ravel(gmm_gmr.gmr.estimate(t)) for t in times])
+        return gmm_gmr.pca.inverse_transform(latent)
+
+    while True:
+        times = np.linspace(t_start, t_end, n_intervals + 1)
+        dt = times[1] - times[0]
+        means = exact_means(times)
+        # The PCA inverse is affine, so latent velocities map through the components
+        derivatives = np.array([gmm_gmr.gmr.estimate_gradient(t)[:, 0] for t in times]).dot(W)
+        table = LookupTable(t_start, dt, means, derivatives, None)
+
+        check = (times[:-1, None] + dt * np.arange(1, check_points) / check_points).ravel()
+        error = float(np.max(np.linalg.norm(table.mean(check) - exact_means(check), axis=1)))
+        if error <= tolerance or n_intervals >= max_intervals:
+            break
+        n_intervals *= 2
+
+    if error > tolerance:
+        raise ValueError(f"Lookup table error {error:.2e} exceeds the tolerance {tolerance:.2e} at {n_intervals} intervals")
+    table.covariances = np.array([W.T.dot(gmm_gmr.gmr.estimate_covariance(t)).dot(W) for t in times])
+    table.max_sampled_error = error
+    return table
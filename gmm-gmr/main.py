@@ -11,17 +11,22 @@ This adaptation is provided under the same licensing terms as the original repos
 """
 import os
 import re
-import h5py
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from mixtures import GMM_GMR
+from mixtures import COVARIANCE_TYPES, GMM_GMR, StreamingGMM_GMR
+from retiming import retime_trajectory
+from lookup_table import compile_lookup_table
+from waypoints import simplify_trajectory, variance_tolerances
+from corpus import scan_corpus, reject_outliers
+from alignment import AlignmentCache
 
 plots_dir = "plots"
 
-if not os.path.exists(plots_dir):
-    os.makedirs(plots_dir)
+# Demonstration duration (seconds)
+demo_duration = 100.0
 
-def save_skill_to_h5(times, trajectory, attrs, folder_path="skills"):
+def save_skill_to_h5(times, trajectory, attrs, folder_path="skills", datasets=None):
+    import h5py
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
     
@@ -34,11 +39,57 @@ def save_skill_to_h5(times, trajectory, attrs, folder_path="skills"):
         f.attrs.update(attrs)
         f.create_dataset("times", data=times)
         f.create_dataset("trajectory", data=trajectory)
+        for name, data in (datasets or {}).items():
+            f.create_dataset(name, data=data)
     
     print(f"Skill saved to {full_path}")
 
+def compact_model(gmm_gmr, min_weight=0.02, merge_distance=0.1):
+    report = gmm_gmr.compact(min_weight=min_weight, merge_distance=merge_distance)
+    print(f"Compacted mixture: {report['components_before']} -> {report['components_after']} components")
+    if report["error_before"] is not None:
+        print(f"Reconstruction error: {report['error_before']:.5f} -> {report['error_after']:.5f}")
+    return report
+
+# Generates the GMR trajectory, retimes it to the end-effector limits and saves the skill
+def export_skill(gmm_gmr, attrs, num_samples=100, v_max=0.5, a_max=1.0, lookup_tolerance=None, template=None):
+    times, trj, covariances = gmm_gmr.generate_trajectory(0.1, num_samples, return_covariance=True)
+
+    # Retimed samples are spaced by the control period so the executor can take one per step
+    dt = 1.0 / attrs.get("control_freq", 20)
+    retimed_times, retimed_trj, _ = retime_trajectory(trj, covariances, v_max=v_max, a_max=a_max, dt=dt)
+    print(f"Retimed duration: {retimed_times[-1]:.2f}s")
+
+    # Waypoints the converging executor has to visit, within a variance-scaled tolerance of the mean
+    waypoint_indices = simplify_trajectory(trj, variance_tolerances(covariances))
+    print(f"Waypoints: {len(waypoint_indices)} of {len(trj)}")
+
+    attrs = dict(attrs, retime_v_max=v_max, retime_a_max=a_max, retime_dt=dt)
+    datasets = {
+        "covariances": covariances,
+        "retimed_times": retimed_times,
+        "retimed_trajectory": retimed_trj,
+        "waypoint_indices": waypoint_indices
+    }
+    if template is not None:
+        datasets["alignment_template"] = template
+    if lookup_tolerance is not None:
+        # Constant-time playback table, so executors never evaluate the mixture
+        try:
+            table = compile_lookup_table(gmm_gmr, lookup_tolerance)
+        except ValueError as e:
+            # Executors fall back to retiming the GMR trajectory for skills without a table
+            print(f"No lookup table saved: {e}")
+        else:
+            print(f"Lookup table: {len(table.means)} samples, max sampled error {table.max_sampled_error:.2e}")
+            attrs.update(table.attrs())
+            datasets.update(table.datasets())
+    save_skill_to_h5(times, trj, attrs, datasets=datasets)
+    return times, trj
+
 # Loads demonstrations in h5 format
 def load_demonstrations(folder_path, dataset_key='eef_positions'):
+    import h5py
     skill_demos = {}
     for filename in sorted(os.listdir(folder_path)):
         if filename.endswith('.h5'):
@@ -67,14 +118,113 @@ def load_demonstrations(folder_path, dataset_key='eef_positions'):
             # print(f"  End: {data[-2:]}")  
     return skill_demos
 
+# Finds demonstrations in h5 format, reading attributes only
+def find_demonstrations(folder_path, dataset_key='eef_positions'):
+    return scan_corpus(folder_path, dataset_key)
+
+def read_demonstration(filepath, dataset_key='eef_positions'):
+    import h5py
+    with h5py.File(filepath, 'r') as f:
+        data = np.array(f[dataset_key])
+    if data.ndim < 2:
+        data = data.reshape(-1, 1)
+    if dataset_key == 'states':
+        data = data[:, 1:4]
+    return data
+
+# Yields demonstrations a few files at a time so only one chunk is ever in memory
+def iter_demonstration_chunks(files, chunk_size, dataset_key='eef_positions'):
+    for start in range(0, len(files), chunk_size):
+        yield [read_demonstration(filepath, dataset_key) for filepath in files[start:start + chunk_size]]
+
+def _read_demonstration_bytes(filepath, dataset_key):
+    import io
+    import h5py
+    # Plain file reads release the GIL, so the pool's reads really overlap; h5py then parses from memory
+    with open(filepath, 'rb') as f:
+        buffer = io.BytesIO(f.read())
+    with h5py.File(buffer, 'r') as f:
+        data = np.array(f[dataset_key])
+    if data.ndim < 2:
+        data = data.reshape(-1, 1)
+    if dataset_key == 'states':
+        data = data[:, 1:4]
+    return data
+
+# Reads the demonstrations of a skill -> files map on a thread pool, yielding each skill as soon as all its files are read
+def iter_skill_demonstrations(skill_files, dataset_key='eef_positions', workers=8):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Submitted skill by skill, so the first skills complete first
+        futures = {}
+        for skill_name, entry in skill_files.items():
+            for i, filepath in enumerate(entry["files"]):
+                futures[executor.submit(_read_demonstration_bytes, filepath, dataset_key)] = (skill_name, i)
+        demos = { skill_name: [None] * len(entry["files"]) for skill_name, entry in skill_files.items() }
+        remaining = { skill_name: len(entry["files"]) for skill_name, entry in skill_files.items() }
+        for future in as_completed(futures):
+            skill_name, i = futures[future]
+            demos[skill_name][i] = future.result()
+            remaining[skill_name] -= 1
+            if remaining[skill_name] == 0:
+                yield skill_name, { "attrs": skill_files[skill_name]["attrs"], "demos": demos.pop(skill_name) }
+
+def alignment_cache_path(cache_dir, attrs):
+    return os.path.join(cache_dir, f"alignment_{attrs['skill_name']}.npz")
+
+def learn_skill_streaming(skill_files, chunk_size=32, dataset_key='eef_positions', v_max=0.5, a_max=1.0, compact=False,
+                          covariance_types=COVARIANCE_TYPES, lookup_tolerance=None, alignment_cache=None, compact_options=None):
+    files = skill_files["files"]
+    attrs = skill_files["attrs"]
+
+    template = None
+    if alignment_cache is not None:
+        # Reuse the cached template, building one needs every demo in memory
+        template = AlignmentCache(alignment_cache_path(alignment_cache, attrs)).template
+    if template is not None:
+        reference = template
+    else:
+        # Align everything against the longest demonstration, as align_trajectories does
+        reference = read_demonstration(files[int(np.argmax(skill_files["lengths"]))], dataset_key)
+
+    gmm_gmr = StreamingGMM_GMR(
+        lambda: iter_demonstration_chunks(files, chunk_size, dataset_key),
+        len(files),
+        reference,
+        3,
+        demo_duration=demo_duration
+    )
+    gmm_gmr.fit(covariance_types=covariance_types)
+    if compact:
+        compact_model(gmm_gmr, **(compact_options or {}))
+
+    num_samples = 100
+    export_skill(gmm_gmr, attrs, num_samples, v_max=v_max, a_max=a_max, lookup_tolerance=lookup_tolerance, template=template)
+
+
+def learn_skill(skill_demos, v_max=0.5, a_max=1.0, compact=False, covariance_types=COVARIANCE_TYPES, lookup_tolerance=None,
+                alignment_cache=None, drift_threshold=0.25, compact_options=None):
+    import matplotlib.pyplot as plt
+    if not os.path.exists(plots_dir):
+        os.makedirs(plots_dir)
 
-def learn_skill(skill_demos):
     demonstrations = skill_demos["demos"]
     attrs          = skill_demos["attrs"]
 
+    template = None
+    if alignment_cache is not None:
+        # Only demos the cache has not seen are aligned, against the skill's DBA template
+        cache = AlignmentCache(alignment_cache_path(alignment_cache, attrs))
+        demonstrations, report = cache.align(demonstrations, drift_threshold=drift_threshold)
+        template = cache.template
+        print(f"Aligned {report['aligned']} of {len(demonstrations)} demos, drift {report['drift']:.1%}"
+              + (", template rebuilt" if report["refreshed"] else ""))
+
     # Fit GMM-GMR
     gmm_gmr = GMM_GMR(demonstrations, 3, demo_duration=demo_duration)
-    gmm_gmr.fit()
+    gmm_gmr.fit(covariance_types=covariance_types)
+    if compact:
+        compact_model(gmm_gmr, **(compact_options or {}))
 
     # Prepare 2D subplot
     fig, axarr = plt.subplots(3, 1, figsize=(8, 12))
@@ -105,8 +255,8 @@ def learn_skill(skill_demos):
         )
 
     # Generate & save the estimated trajectory
-    times, trj = gmm_gmr.generate_trajectory(0.1, num_samples)
-    save_skill_to_h5(times, trj, attrs)
+    times, trj = export_skill(gmm_gmr, attrs, num_samples, v_max=v_max, a_max=a_max, lookup_tolerance=lookup_tolerance,
+                              template=template)
 
     # Plot the estimate on the same 0 - 99 axis
     est_idx = np.arange(num_samples)
@@ -161,10 +311,53 @@ def learn_skill(skill_demos):
 
 
 
-# Demonstration duration (seconds)
-demo_duration = 100.0
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Learn GMM-GMR skills from demonstrations")
+    parser.add_argument("--demos", default='../demonstration_collection/smoothed_demonstrations')
+    parser.add_argument("--streaming", action="store_true",
+                        help="Train with bounded memory: incremental PCA and mini-batch EM over demo chunks read from disk")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Demonstrations per chunk in streaming mode")
+    parser.add_argument("--v-max", type=float, default=0.5, help="End-effector speed limit (m/s) for retiming")
+    parser.add_argument("--a-max", type=float, default=1.0, help="End-effector acceleration limit (m/s^2) for retiming")
+    parser.add_argument("--covariance-types", nargs="+", default=list(COVARIANCE_TYPES), choices=COVARIANCE_TYPES,
+                        help="Covariance structures searched by BIC together with the number of gaussians")
+    parser.add_argument("--lookup-table", type=float, default=None, metavar="TOLERANCE",
+                        help="Also store a constant-time GMR lookup table accurate to TOLERANCE (m). Executors only "
+                             "use it when their control period differs from the retimed one the skill is saved with "
+                             "(1 / control_freq of the demos); otherwise the retimed samples are played back directly")
+    parser.add_argument("--compact", action="store_true",
+                        help="Prune low-weight gaussians and merge close ones after BIC; this changes the regressed trajectory")
+    parser.add_argument("--compact-min-weight", type=float, default=0.02, help="Gaussians with a smaller weight are pruned")
+    parser.add_argument("--compact-merge-distance", type=float, default=0.1,
+                        help="Gaussians closer than this Bhattacharyya distance are merged")
+    parser.add_argument("--reject-outliers", action="store_true",
+                        help="Score each demo against the other demos of its skill and leave out the outliers")
+    parser.add_argument("--outlier-threshold", type=float, default=3.5, help="Robust z-score above which a demo is an outlier")
+    parser.add_argument("--quarantine", default=None, metavar="DIR", help="Move rejected demos into DIR so later runs skip them")
+    parser.add_argument("--alignment-cache", default=None, metavar="DIR",
+                        help="Align against a cached per-skill DBA template in DIR, aligning only new demos")
+    parser.add_argument("--drift-threshold", type=float, default=0.25,
+                        help="Relative increase of the alignment cost above which the template is rebuilt")
+    args = parser.parse_args(argv)
+    compact_options = { "min_weight": args.compact_min_weight, "merge_distance": args.compact_merge_distance }
+
+    skill_files = find_demonstrations(args.demos, dataset_key='eef_positions')
+    if args.reject_outliers:
+        skill_files, rejected = reject_outliers(skill_files, dataset_key='eef_positions', threshold=args.outlier_threshold,
+                                                quarantine_dir=args.quarantine)
+        print(f"Rejected {len(rejected)} outlier demonstrations")
 
-sk_demos = load_demonstrations('../demonstration_collection/smoothed_demonstrations', dataset_key='eef_positions') # TODO: make better
+    if args.streaming:
+        for files in skill_files.values():
+            learn_skill_streaming(files, chunk_size=args.chunk_size, v_max=args.v_max, a_max=args.a_max,
+                                  compact=args.compact, compact_options=compact_options, covariance_types=args.covariance_types,
+                                  lookup_tolerance=args.lookup_table, alignment_cache=args.alignment_cache)
+    else:
+        # Training starts on the first skill that is fully read while the others are still loading
+        for _, demos in iter_skill_demonstrations(skill_files, dataset_key='eef_positions'):
+            learn_skill(demos, v_max=args.v_max, a_max=args.a_max, compact=args.compact, compact_options=compact_options,
+                        covariance_types=args.covariance_types, lookup_tolerance=args.lookup_table,
+                        alignment_cache=args.alignment_cache, drift_threshold=args.drift_threshold)
 
-for demos in sk_demos.values():
-    learn_skill(demos)
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,14 @@ which is based on the following paper:
 This adaptation is provided under the same licensing terms as the original repository.
 """
 
+import os
+import tempfile
 import numpy as np
-from utils import align_trajectories, gaussian
-from sklearn.decomposition import PCA
-from sklearn.mixture import GaussianMixture
+from numpy.lib.format import open_memmap
+from utils import align_trajectories, align_to_reference
+
+# Covariance structures BIC chooses from by default, together with the number of gaussians
+COVARIANCE_TYPES = ("full", "diag", "tied")
 
 class GMM_GMR(object):
     """
@@ -43,9 +47,19 @@ class GMM_GMR(object):
         self.N = self.trajectories.shape[0]  # number of demonstrations
         self.D = self.trajectories.shape[2]  # data dimensions
 
+        # sklearn is imported lazily so importing this module stays cheap
+        from sklearn.decomposition import PCA
         self.pca = PCA(n_components)
 
-    def fit(self):
+    def fit(self, components=(2, 3, 4, 5, 6), random_state=None, covariance_types=COVARIANCE_TYPES):
+        """
+        :param components: Candidate numbers of gaussians, the best one is selected by BIC.
+        :param random_state: Seed forwarded to every GaussianMixture fit.
+        :param covariance_types: Candidate covariance structures ("full", "diag", "tied"), searched
+            together with the number of gaussians. Diagonal covariances carry no time/space
+            correlation, so each component contributes a constant to the regression.
+        """
+        from sklearn.mixture import GaussianMixture
         # Flatten the trajectories for PCA
         trajectories_latent = self.pca.fit_transform(self.trajectories.reshape(-1, self.D))
         print("Explained variance: {}%".format(np.sum(self.pca.explained_variance_ratio_) * 100))
@@ -57,35 +71,89 @@ class GMM_GMR(object):
 
         spatio_temporal = np.concatenate((temporal, trajectories_latent), axis=1)
 
-        # Use BIC to select the best number of mixtures
+        # Use BIC to select the best number of mixtures and covariance structure
         # components = [5, 10, 15, 20, 25, 30, 35, 40, 45]
-        components = [2,3,4,5,6] # number of gaussians 
+        candidates = [(c, t) for t in covariance_types for c in components] # number of gaussians, covariance type
         bics = []
-        for c in components:
-            gmm = GaussianMixture(n_components=c)
+        for c, t in candidates:
+            gmm = GaussianMixture(n_components=c, covariance_type=t, random_state=random_state)
             gmm.fit(spatio_temporal)
             bics.append(gmm.bic(spatio_temporal))
 
-        c = components[np.argmin(bics)]
-        print("Selected n mixtures: {}".format(c))
+        c, t = candidates[np.argmin(bics)]
+        print("Selected n mixtures: {} ({} covariances)".format(c, t))
 
-        self.gmm = GaussianMixture(n_components=c)
-        self.gmm.fit(spatio_temporal)
-        print("Is GMM converged: ", self.gmm.converged_)
+        gmm = GaussianMixture(n_components=c, covariance_type=t, random_state=random_state)
+        gmm.fit(spatio_temporal)
+        print("Is GMM converged: ", gmm.converged_)
+        self._set_mixture(gmm)
 
+    def _set_mixture(self, gmm):
+        self.gmm = gmm
         self.gmr = GMR(self.gmm)
         self.centers = self.gmm.means_
         self.centers_temporal = self.centers[:, 0]  # These are now in seconds
         self.centers_spatial_latent = self.centers[:, 1:]
         self.centers_spatial = self.pca.inverse_transform(self.centers_spatial_latent)
 
-    def generate_trajectory(self, interval=0.1, num_samples=None):
+    def reconstruction_error(self):
+        """
+        Mean distance between the aligned demonstrations and the GMR estimate at the same times,
+        or None when the demonstrations are no longer in memory.
+        """
+        if getattr(self, "trajectories", None) is None:
+            return None
+        times = np.arange(self.T) * self.demo_duration / self.T
+        estimate = self.pca.inverse_transform(np.array([np.ravel(self.gmr.estimate(t)) for t in times]))
+        return float(np.mean(np.linalg.norm(self.trajectories - estimate[None], axis=2)))
+
+    def compact(self, min_weight=0.02, merge_distance=0.1):
+        """
+        Shrink the fitted mixture: prune components with negligible weight, then repeatedly merge
+        the closest pair of components (Bhattacharyya distance) by moment matching. GMR weighs each
+        component by its mixture weight times its input density, so a pruned component only had
+        influence where no heavier component covers the input; check the report for the change.
+
+        :param min_weight: Components with a smaller mixture weight are dropped.
+        :param merge_distance: Pairs of components closer than this are merged.
+        :return: A dict with the number of components and the reconstruction error before and
+            after compaction (errors are None for models fit without the demonstrations in memory).
+        """
+        report = { "components_before": self.gmm.n_components, "error_before": self.reconstruction_error() }
+
+        weights = self.gmm.weights_.copy()
+        means = self.gmm.means_.copy()
+        covariances = full_covariances(self.gmm).copy()
+
+        keep = weights >= min_weight
+        if not np.any(keep):
+            keep[np.argmax(weights)] = True
+        weights, means, covariances = weights[keep] / weights[keep].sum(), means[keep], covariances[keep]
+
+        while len(weights) > 1:
+            pairs = [(bhattacharyya_distance(means[i], covariances[i], means[j], covariances[j]), i, j)
+                     for i in range(len(weights)) for j in range(i + 1, len(weights))]
+            distance, i, j = min(pairs)
+            if distance >= merge_distance:
+                break
+            w, mu, cov = merge_components(weights[[i, j]], means[[i, j]], covariances[[i, j]])
+            weights[i], means[i], covariances[i] = w, mu, cov
+            weights, means, covariances = np.delete(weights, j), np.delete(means, j, axis=0), np.delete(covariances, j, axis=0)
+
+        self._set_mixture(CompactMixture(weights, means, covariances))
+        report["components_after"] = self.gmm.n_components
+        report["error_after"] = self.reconstruction_error()
+        return report
+
+    def generate_trajectory(self, interval=0.1, num_samples=None, return_covariance=False):
         """
         Generate a trajectory using GMR.
         
         :param interval: The sampling interval (in seconds) for the generated trajectory.
+        :param return_covariance: Also return the GMR conditional covariance at each time.
         :return: A tuple (times, trajectory), where 'times' are in seconds and 'trajectory'
-                 is the spatial data reconstructed from the latent space.
+                 is the spatial data reconstructed from the latent space. With return_covariance
+                 a third element holds the (T, D, D) covariances in the spatial space.
         """
         if num_samples is not None:
             times = np.linspace(min(self.centers_temporal), max(self.centers_temporal), num_samples)
@@ -97,38 +165,328 @@ class GMM_GMR(object):
             trj.append(self.gmr.estimate(t))
         trj = np.squeeze(np.array(trj))
         trj = self.pca.inverse_transform(trj)
-        return times, trj
+        if not return_covariance:
+            return times, trj
+
+        # Latent covariances map back through the PCA projection
+        W = self.pca.components_
+        covariances = np.array([W.T.dot(self.gmr.estimate_covariance(t)).dot(W) for t in times])
+        return times, trj, covariances
+
+def bhattacharyya_distance(mu_1, cov_1, mu_2, cov_2):
+    cov = (cov_1 + cov_2) / 2
+    diff = mu_1 - mu_2
+    _, log_det = np.linalg.slogdet(cov)
+    _, log_det_1 = np.linalg.slogdet(cov_1)
+    _, log_det_2 = np.linalg.slogdet(cov_2)
+    return diff.dot(np.linalg.solve(cov, diff)) / 8 + (log_det - (log_det_1 + log_det_2) / 2) / 2
+
+def merge_components(weights, means, covariances):
+    """
+    Moment matching: the single gaussian with the same weight, mean and covariance as the
+    given components together.
+    """
+    weight = weights.sum()
+    mean = weights.dot(means) / weight
+    diff = means - mean
+    covariance = np.einsum('k,kij->ij', weights, covariances + np.einsum('ki,kj->kij', diff, diff)) / weight
+    return weight, mean, covariance
+
+class CompactMixture(object):
+    """
+    Fixed gaussian mixture produced by GMM_GMR.compact, exposing the weights_, means_ and
+    covariances_ attributes GMR reads from sklearn's GaussianMixture.
+    """
+    def __init__(self, weights, means, covariances):
+        self.weights_ = weights
+        self.means_ = means
+        self.covariances_ = covariances
+        self.n_components = len(weights)
+
+def full_covariances(gmm):
+    """
+    (K, D, D) covariances of a fitted mixture whatever its covariance_type.
+    """
+    covariances = gmm.covariances_
+    K, D = gmm.means_.shape
+    covariance_type = getattr(gmm, "covariance_type", "full")
+    if covariance_type == "tied":
+        return np.repeat(covariances[None], K, axis=0)
+    if covariance_type == "diag":
+        return covariances[:, :, None] * np.eye(D)
+    if covariance_type == "spherical":
+        return covariances[:, None, None] * np.eye(D)
+    return covariances
 
 class GMR:
-    def __init__(self, gmm):
+    """
+    Gaussian mixture regression of the output dimensions on the first n_inputs dimensions
+    (time by default). Component k is weighted by beta_k = pi_k N_k(xi) / sum_j pi_j N_j(xi), as in
+    Calinon et al. (2007), pi_k being the mixture weight. The inverse Cholesky factor of each
+    component's input covariance, the regression matrices and the conditional covariances are
+    computed once with triangular solves, so a query only multiplies by small triangular matrices.
+    """
+    def __init__(self, gmm, n_inputs=1):
         self.gmm = gmm
         self.n_components = self.gmm.means_.shape[0]
+        self.n_inputs = n_inputs
 
-    def xi_s_k(self, xi_t, k):
-        cov_k = self.gmm.covariances_[k]
-        mu_k = self.gmm.means_[k]
+        covariances = full_covariances(gmm)
+        i, o = slice(0, n_inputs), slice(n_inputs, None)
+        self._mu_in = gmm.means_[:, i]
+        self._mu_out = gmm.means_[:, o]
+        from scipy.linalg import cho_solve, solve_triangular
+        self._chol_in = np.linalg.cholesky(covariances[:, i, i])
+        # L^-1, so the Mahalanobis terms of a query are a product instead of a solve
+        self._inv_chol_in = np.array([solve_triangular(L, np.eye(n_inputs), lower=True) for L in self._chol_in])
+        cov_io = covariances[:, i, o]
+        # Sigma_oi Sigma_ii^-1 through the Cholesky factor: solve L L^T A^T = Sigma_io
+        self._regression = np.array([cho_solve((L, True), c).T for L, c in zip(self._chol_in, cov_io)])
+        self._cov_out = covariances[:, o, o] - np.matmul(self._regression, cov_io)
+        # The mixture weights are folded into the normalization, they are constant in the inputs
+        self._log_norm = np.log(np.maximum(gmm.weights_, np.finfo(float).tiny)) \
+            - np.sum(np.log(np.diagonal(self._chol_in, axis1=1, axis2=2)), axis=1) - 0.5 * n_inputs * np.log(2 * np.pi)
+
+    def _log_probs(self, xi):
+        # Log of pi_k times the density of xi under the input marginal of every component
+        diff = np.reshape(xi, (1, self.n_inputs)) - self._mu_in
+        z = np.matmul(self._inv_chol_in, diff[:, :, None])[:, :, 0]
+        return self._log_norm - 0.5 * np.sum(z ** 2, axis=1), diff
 
-        mu_t_k = mu_k[0:1].reshape(-1, 1)
-        mu_s_k = mu_k[1:].reshape(-1, 1)
-        cov_t_k = cov_k[0:1, 0:1]
-        cov_st_k = cov_k[1:, 0:1]
+    def _betas(self, xi):
+        log_probs, diff = self._log_probs(xi)
+        return np.exp(log_probs - np.logaddexp.reduce(log_probs)), diff
 
-        return mu_s_k + cov_st_k.dot(np.linalg.inv(cov_t_k)).dot(xi_t - mu_t_k)
+    def xi_s_k(self, xi_t, k):
+        diff = np.reshape(xi_t, (self.n_inputs,)) - self._mu_in[k]
+        return (self._mu_out[k] + self._regression[k].dot(diff)).reshape(-1, 1)
+
+    def cov_s_k(self, k):
+        return self._cov_out[k]
 
     def get_denom(self, xi_t):
-        probs = 0.0
-        for k in range(self.n_components):
-            mu_t_k = self.gmm.means_[k][0]
-            var_t_k = self.gmm.covariances_[k][0, 0]
-            probs += gaussian(xi_t, mu_t_k, var_t_k)
-        return probs
+        return float(np.sum(np.exp(self._log_probs(xi_t)[0])))
 
     def estimate(self, xi_t):
-        result = 0.0
+        betas, diff = self._betas(xi_t)
+        means = self._mu_out + np.matmul(self._regression, diff[:, :, None])[:, :, 0]
+        return betas.dot(means).reshape(-1, 1)
+
+    def estimate_gradient(self, xi_t):
+        """
+        Jacobian (O, n_inputs) of the GMR estimate with respect to the inputs, i.e. the velocity
+        of the regressed trajectory when conditioning on time.
+        """
+        betas, diff = self._betas(xi_t)
+        means = self._mu_out + np.matmul(self._regression, diff[:, :, None])[:, :, 0]
+        # Gradient of each component's log density, then of the normalized responsibilities
+        z = np.matmul(self._inv_chol_in, diff[:, :, None])
+        grad_log = -np.matmul(np.swapaxes(self._inv_chol_in, 1, 2), z)[:, :, 0]
+        grad_betas = betas[:, None] * (grad_log - betas.dot(grad_log))
+        return np.einsum('k,koi->oi', betas, self._regression) + means.T.dot(grad_betas)
+
+    def estimate_covariance(self, xi_t):
+        """
+        Conditional covariance of the output at xi_t, combining the per-component
+        conditional covariances and the spread of the component means.
+        """
+        betas, diff = self._betas(xi_t)
+        means = self._mu_out + np.matmul(self._regression, diff[:, :, None])[:, :, 0]
+        mean = betas.dot(means)
+        second_moment = np.einsum('k,kij->ij', betas, self._cov_out + np.einsum('ki,kj->kij', means, means))
+        return second_moment - np.outer(mean, mean)
+
+class MiniBatchGaussianMixture(object):
+    """
+    Full covariance gaussian mixture trained with stepwise (online) EM.
+
+    Sufficient statistics are blended with a decaying step size after every batch, so
+    only one batch needs to be in memory at a time. Exposes the same weights_, means_
+    and covariances_ attributes as sklearn's GaussianMixture so it can be used by GMR.
+    """
+    def __init__(self, n_components, reg_covar=1e-6, decay=0.6, tol=1e-3):
+        """
+        :param n_components: Number of gaussians.
+        :param reg_covar: Non-negative regularization added to the covariance diagonals.
+        :param decay: Step size exponent, the step for batch t is (t + 2) ** -decay.
+            Must be in (0.5, 1] for the online EM to converge.
+        :param tol: Convergence threshold on the change of the mean log-likelihood between epochs.
+        """
+        self.n_components = n_components
+        self.reg_covar = reg_covar
+        self.decay = decay
+        self.tol = tol
+        self.n_iter_ = 0
+        self.converged_ = False
+
+    def initialize(self, gmm):
+        """
+        Start from the parameters of a fitted GaussianMixture (e.g. fit on a subsample).
+        """
+        self.weights_ = gmm.weights_.copy()
+        self.means_ = gmm.means_.copy()
+        self.covariances_ = full_covariances(gmm).copy()
+        self._s0 = self.weights_.copy()
+        self._s1 = self.weights_[:, None] * self.means_
+        self._s2 = self.weights_[:, None, None] * (self.covariances_ + np.einsum('ki,kj->kij', self.means_, self.means_))
+
+    def _log_resp(self, X):
+        D = X.shape[1]
+        log_prob = np.empty((X.shape[0], self.n_components))
         for k in range(self.n_components):
-            xi_s_k_head = self.xi_s_k(xi_t, k)
-            mu_t_k = self.gmm.means_[k][0]
-            var_t_k = self.gmm.covariances_[k][0, 0]
-            beta_k = gaussian(xi_t, mu_t_k, var_t_k) / self.get_denom(xi_t)
-            result += xi_s_k_head * beta_k
-        return result
+            chol = np.linalg.cholesky(self.covariances_[k])
+            z = np.linalg.solve(chol, (X - self.means_[k]).T)
+            log_det = 2.0 * np.sum(np.log(np.diag(chol)))
+            log_prob[:, k] = -0.5 * (D * np.log(2 * np.pi) + log_det + np.sum(z ** 2, axis=0))
+        log_prob += np.log(self.weights_)
+        log_norm = np.logaddexp.reduce(log_prob, axis=1)
+        return log_prob - log_norm[:, None], log_norm
+
+    def partial_fit(self, X):
+        """
+        Run one stepwise EM update on a batch.
+
+        :return: Mean log-likelihood of the batch under the parameters before the update.
+        """
+        log_resp, log_norm = self._log_resp(X)
+        resp = np.exp(log_resp)
+        n = X.shape[0]
+
+        s0 = resp.sum(axis=0) / n
+        s1 = resp.T.dot(X) / n
+        s2 = np.array([(resp[:, k:k + 1] * X).T.dot(X) / n for k in range(self.n_components)])
+
+        eta = (self.n_iter_ + 2) ** -self.decay
+        self._s0 = (1 - eta) * self._s0 + eta * s0
+        self._s1 = (1 - eta) * self._s1 + eta * s1
+        self._s2 = (1 - eta) * self._s2 + eta * s2
+        self.n_iter_ += 1
+
+        # M step
+        s0 = np.maximum(self._s0, 10 * np.finfo(float).eps)
+        self.weights_ = s0 / s0.sum()
+        self.means_ = self._s1 / s0[:, None]
+        self.covariances_ = self._s2 / s0[:, None, None] - np.einsum('ki,kj->kij', self.means_, self.means_)
+        self.covariances_ += self.reg_covar * np.eye(X.shape[1])
+        return float(np.mean(log_norm))
+
+class StreamingGMM_GMR(GMM_GMR):
+    """
+    Bounded-memory GMM-GMR for demonstration sets that do not fit in RAM.
+
+    Demonstrations are read in chunks, aligned one at a time against a fixed reference and
+    spilled to a disk-backed array, PCA is fit incrementally, the number of gaussians is
+    selected by BIC on a bounded reservoir sample, and the mixture is refined with
+    mini-batch EM over the aligned chunks.
+    """
+    def __init__(self, demo_chunks, n_demos, reference, n_components, demo_duration=5.0,
+                 max_reservoir=20000, scratch_dir=None):
+        """
+        :param demo_chunks: Callable returning a fresh iterable of demonstration chunks, each
+            chunk being a list of (T_i, D) arrays.
+        :param n_demos: Total number of demonstrations yielded by demo_chunks.
+        :param reference: (T, D) trajectory every demonstration is aligned to.
+        :param n_components: Number of PCA components.
+        :param demo_duration: The actual duration (in seconds) of the demonstration.
+        :param max_reservoir: Maximum number of samples kept in memory for BIC selection.
+        :param scratch_dir: Folder for the temporary aligned trajectory file.
+        """
+        self.demo_duration = demo_duration
+        self.demo_chunks = demo_chunks
+        self.reference = reference
+        self.max_reservoir = max_reservoir
+        self.scratch_dir = scratch_dir
+
+        self.T = reference.shape[0]
+        self.N = n_demos
+        self.D = reference.shape[1]
+
+        from sklearn.decomposition import IncrementalPCA
+        self.pca = IncrementalPCA(n_components)
+
+    def _update_reservoir(self, rng, reservoir_t, reservoir_x, seen, rows_t, rows):
+        # Reservoir sampling keeps a uniform subsample of every row seen so far
+        fill = min(self.max_reservoir - reservoir_x.shape[0], rows.shape[0])
+        reservoir_t = np.concatenate((reservoir_t, rows_t[:fill]))
+        reservoir_x = np.concatenate((reservoir_x, rows[:fill]))
+        slots = rng.randint(0, seen + np.arange(fill, rows.shape[0]) + 1)
+        keep = slots < self.max_reservoir
+        reservoir_t[slots[keep]] = rows_t[fill:][keep]
+        reservoir_x[slots[keep]] = rows[fill:][keep]
+        return reservoir_t, reservoir_x
+
+    def _aligned_chunks(self, chunk_size):
+        for start in range(0, self.N, chunk_size):
+            yield self.trajectories[start:start + chunk_size]
+
+    def fit(self, components=(2, 3, 4, 5, 6), random_state=None, max_epochs=10, covariance_types=COVARIANCE_TYPES):
+        """
+        :param components: Candidate numbers of gaussians, the best one is selected by BIC.
+        :param covariance_types: Candidate covariance structures for the BIC search; the
+            mini-batch refinement always continues from the selected model with full covariances.
+        :param random_state: Seed for the reservoir sampling and the initial GaussianMixture fits.
+        :param max_epochs: Maximum number of mini-batch EM passes over the aligned demonstrations.
+        """
+        from sklearn.mixture import GaussianMixture
+        rng = np.random.RandomState(random_state)
+        time_scale = self.demo_duration / self.T
+        temporal = (np.arange(self.T) * time_scale).reshape(-1, 1)
+
+        # Pass 1: align each demonstration, spill it to disk and update the PCA and reservoir
+        scratch = tempfile.NamedTemporaryFile(suffix=".npy", dir=self.scratch_dir, delete=False)
+        scratch.close()
+        self.trajectories = open_memmap(scratch.name, mode="w+", dtype=np.float64, shape=(self.N, self.T, self.D))
+        reservoir_t = np.empty((0, 1))
+        reservoir_x = np.empty((0, self.D))
+        seen = 0
+        chunk_size = 1
+        idx = 0
+        try:
+            for chunk in self.demo_chunks():
+                chunk_size = max(chunk_size, len(chunk))
+                aligned = np.array([align_to_reference(self.reference, d) for d in chunk])
+                self.trajectories[idx:idx + len(aligned)] = aligned
+                idx += len(aligned)
+
+                rows = aligned.reshape(-1, self.D)
+                if rows.shape[0] >= self.pca.n_components:
+                    self.pca.partial_fit(rows)
+
+                rows_t = np.tile(temporal, (len(aligned), 1))
+                reservoir_t, reservoir_x = self._update_reservoir(rng, reservoir_t, reservoir_x, seen, rows_t, rows)
+                seen += rows.shape[0]
+            self.trajectories.flush()
+            print("Explained variance: {}%".format(np.sum(self.pca.explained_variance_ratio_) * 100))
+
+            # Select the number of gaussians on the reservoir
+            sample = np.concatenate((reservoir_t, self.pca.transform(reservoir_x)), axis=1)
+            fits = []
+            for t in covariance_types:
+                for c in components:
+                    gmm = GaussianMixture(n_components=c, covariance_type=t, random_state=random_state)
+                    gmm.fit(sample)
+                    fits.append((gmm.bic(sample), gmm))
+            bic, init_gmm = min(fits, key=lambda f: f[0])
+            print("Selected n mixtures: {} ({} covariances)".format(init_gmm.n_components, init_gmm.covariance_type))
+
+            # Pass 2+: mini-batch EM over the aligned demonstrations
+            self.gmm = MiniBatchGaussianMixture(init_gmm.n_components)
+            self.gmm.initialize(init_gmm)
+            previous = -np.inf
+            for epoch in range(max_epochs):
+                log_likelihoods = []
+                for aligned in self._aligned_chunks(chunk_size):
+                    latent = self.pca.transform(np.asarray(aligned).reshape(-1, self.D))
+                    rows_t = np.tile(temporal, (len(aligned), 1))
+                    log_likelihoods.append(self.gmm.partial_fit(np.concatenate((rows_t, latent), axis=1)))
+                current = np.mean(log_likelihoods)
+                if abs(current - previous) < self.gmm.tol:
+                    self.gmm.converged_ = True
+                    break
+                previous = current
+            print("Is GMM converged: ", self.gmm.converged_)
+        finally:
+            del self.trajectories
+            os.remove(scratch.name)
+
+        self._set_mixture(self.gmm)
@@ -0,0 +1,62 @@
+import numpy as np
+from retiming import retime_trajectory
+
+def skill_samples(skill, target_position, dt, v_max=0.5, a_max=1.0, lookup_path_samples=400):
+    """
+    Trajectory of a skill sampled once per control step and shifted to its target.
+
+    :param skill: Skill to sample, using its retimed trajectory when it was saved with one.
+    :param target_position: Target offset, or None for skills without a target.
+    :param dt: Control period.
+    :return: (T, D) positions.
+    """
+    retimed_data = skill.retimed_trajectory_data()
+    if retimed_data is not None and len(retimed_data[0]) > 1 and np.isclose(retimed_data[0][1] - retimed_data[0][0], dt):
+        samples = retimed_data[1]
+    elif skill.lookup_table() is not None:
+        # Retime a dense path read from the compiled table instead of the coarse GMR samples
+        table = skill.lookup_table()
+        times = np.linspace(table.t_start, table.t_end, lookup_path_samples)
+        _, samples, _ = retime_trajectory(table.mean(times), table.covariance(times), v_max=v_max, a_max=a_max, dt=dt)
+    else:
+        _, trajectory = skill.trajectory_data()
+        _, samples, _ = retime_trajectory(trajectory, skill.covariances(), v_max=v_max, a_max=a_max, dt=dt)
+    return samples if target_position is None else samples + target_position
+
+def sample_velocities(samples, dt):
+    if len(samples) < 2:
+        return np.zeros_like(samples)
+    return np.gradient(samples, dt, axis=0)
+
+def hermite_transition(p0, v0, p1, v1, dt, v_max=0.5):
+    """
+    Cubic Hermite segment joining the state (p0, v0) to (p1, v1), sampled every dt seconds.
+    Matching both endpoint velocities lets the arm flow from one skill into the next without
+    stopping.
+
+    :return: (N, D) intermediate positions, excluding p0 and including p1.
+    """
+    distance = np.linalg.norm(p1 - p0)
+    # A cubic through the chord peaks at about 1.5 times the average speed
+    duration = max(1.5 * distance / v_max, 2 * dt)
+    n = int(np.ceil(duration / dt))
+    duration = n * dt
+    s = np.arange(1, n + 1)[:, None] / n
+    h00 = 2 * s ** 3 - 3 * s ** 2 + 1
+    h10 = s ** 3 - 2 * s ** 2 + s
+    h01 = -2 * s ** 3 + 3 * s ** 2
+    h11 = s ** 3 - s ** 2
+    return h00 * p0 + h10 * duration * v0 + h01 * p1 + h11 * duration * v1
+
+def blend_indices(n_samples, blend_steps, grip_change_before, grip_change_after):
+    """
+    Range of a skill's samples that is tracked when it is blended with its neighbours. The head
+    and tail are replaced by transitions, except next to a gripper change, where the skill has to
+    reach its end point exactly before the gripper acts.
+
+    :return: A tuple (entry, exit) of sample indices, exit inclusive.
+    """
+    blend_steps = min(blend_steps, max(n_samples // 4, 0))
+    entry = 0 if grip_change_before else blend_steps
+    exit_ = n_samples - 1 if grip_change_after else n_samples - 1 - blend_steps
+    return entry, max(exit_, entry)
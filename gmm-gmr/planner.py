@@ -0,0 +1,234 @@
+import os
+import re
+import sys
+import heapq
+import hashlib
+import argparse
+import itertools
+
+# STRIPS subset of PDDL with typing and negative preconditions, enough for the domains in tasks/
+
+def parse_sexp(text):
+    """
+    Nested lists of lower case tokens from PDDL text, comments removed.
+    """
+    tokens = re.findall(r"\(|\)|[^\s()]+", re.sub(r";[^\n]*", "", text).lower())
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            expr = stack.pop()
+            stack[-1].append(expr)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError("Unbalanced parentheses in PDDL")
+    return stack[0][0]
+
+def parse_typed_list(tokens, default="object"):
+    """
+    ['a', 'b', '-', 't', 'c'] -> [('a', 't'), ('b', 't'), ('c', 'object')]
+    """
+    typed, pending = [], []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "-":
+            typed.extend((name, tokens[i + 1]) for name in pending)
+            pending = []
+            i += 2
+        else:
+            pending.append(tokens[i])
+            i += 1
+    typed.extend((name, default) for name in pending)
+    return typed
+
+def parse_literals(expr):
+    """
+    :return: Positive and negative atoms of a conjunction, each atom a tuple of tokens.
+    """
+    if not expr:
+        return [], []
+    if expr[0] == "and":
+        positive, negative = [], []
+        for sub in expr[1:]:
+            p, n = parse_literals(sub)
+            positive += p
+            negative += n
+        return positive, negative
+    if expr[0] == "not":
+        return [], [tuple(expr[1])]
+    return [tuple(expr)], []
+
+def _sections(expr):
+    return { section[0]: section[1:] for section in expr[2:] if isinstance(section, list) }
+
+class Action(object):
+    def __init__(self, name, parameters, precondition, effect):
+        self.name = name
+        self.parameters = parameters
+        self.pre_positive, self.pre_negative = precondition
+        self.add, self.delete = effect
+
+class Domain(object):
+    def __init__(self, name, parents, actions):
+        self.name = name
+        self.parents = parents
+        self.actions = actions
+
+    def is_subtype(self, type_name, ancestor):
+        while type_name is not None:
+            if type_name == ancestor or ancestor == "object":
+                return True
+            type_name = self.parents.get(type_name)
+        return False
+
+class Problem(object):
+    def __init__(self, name, domain_name, objects, init, goal):
+        self.name = name
+        self.domain_name = domain_name
+        self.objects = objects
+        self.init = frozenset(init)
+        self.goal_positive, self.goal_negative = goal
+
+    def objects_of_type(self, type_name):
+        return [name for name, object_type in self.objects if object_type == type_name]
+
+def parse_domain(text):
+    expr = parse_sexp(text)
+    name = expr[1][1]
+    parents = {}
+    actions = []
+    for section in expr[2:]:
+        if section[0] == ":types":
+            parents.update({ child: parent for child, parent in parse_typed_list(section[1:]) })
+        elif section[0] == ":action":
+            fields = dict(zip(section[2::2], section[3::2]))
+            actions.append(Action(section[1], parse_typed_list(fields.get(":parameters", [])),
+                                  parse_literals(fields.get(":precondition", [])),
+                                  parse_literals(fields.get(":effect", []))))
+    return Domain(name, parents, actions)
+
+def parse_problem(text):
+    expr = parse_sexp(text)
+    sections = _sections(expr)
+    return Problem(expr[1][1], sections[":domain"][0], parse_typed_list(sections.get(":objects", [])),
+                   [tuple(atom) for atom in sections.get(":init", [])], parse_literals(sections[":goal"][0]))
+
+def ground_actions(domain, problem):
+    """
+    Every action applied to every type-compatible combination of objects.
+
+    :return: List of (command, pre_positive, pre_negative, add, delete) with frozenset atoms.
+    """
+    grounded = []
+    for action in domain.actions:
+        candidates = [[name for name, object_type in problem.objects if domain.is_subtype(object_type, param_type)]
+                      for _, param_type in action.parameters]
+        variables = [variable for variable, _ in action.parameters]
+        for args in itertools.product(*candidates):
+            binding = dict(zip(variables, args))
+            substitute = lambda atoms: frozenset(tuple(binding.get(token, token) for token in atom) for atom in atoms)
+            command = "(" + " ".join((action.name,) + args) + ")"
+            grounded.append((command, substitute(action.pre_positive), substitute(action.pre_negative),
+                             substitute(action.add), substitute(action.delete)))
+    return grounded
+
+def plan(domain, problem, max_expansions=200000):
+    """
+    Greedy best-first search on the number of unsatisfied goal atoms.
+
+    :return: The list of commands, or None if the goal is unreachable.
+    """
+    goal_positive, goal_negative = frozenset(problem.goal_positive), frozenset(problem.goal_negative)
+    heuristic = lambda state: len(goal_positive - state) + len(goal_negative & state)
+    actions = ground_actions(domain, problem)
+
+    counter = itertools.count()
+    start = problem.init
+    frontier = [(heuristic(start), next(counter), start)]
+    parents = { start: None }
+    while frontier and len(parents) <= max_expansions:
+        h, _, state = heapq.heappop(frontier)
+        if h == 0:
+            commands = []
+            while parents[state] is not None:
+                state, command = parents[state]
+                commands.append(command)
+            return commands[::-1]
+        for command, pre_positive, pre_negative, add, delete in actions:
+            if pre_positive <= state and not (pre_negative & state):
+                successor = (state - delete) | add
+                if successor not in parents:
+                    parents[successor] = (state, command)
+                    heapq.heappush(frontier, (heuristic(successor), next(counter), successor))
+    return None
+
+def domain_file_for(task_file):
+    # Each folder in tasks/ holds one domain.pddl shared by its problems
+    return os.path.join(os.path.dirname(os.path.abspath(task_file)), "domain.pddl")
+
+def problem_objects(task_file, type_name="block"):
+    with open(task_file) as f:
+        return parse_problem(f.read()).objects_of_type(type_name)
+
+def solve(task_file, domain_file=None, cache_dir="plan_cache"):
+    """
+    Plans a problem file, reusing a cached plan when the domain and problem text are unchanged.
+
+    :param cache_dir: Folder for the cached plans, None disables the cache.
+    :return: The commands in the format of the .soln files.
+    """
+    domain_file = domain_file_for(task_file) if domain_file is None else domain_file
+    with open(domain_file) as f:
+        domain_text = f.read()
+    with open(task_file) as f:
+        problem_text = f.read()
+
+    cache_file = None
+    if cache_dir is not None:
+        key = hashlib.sha256((domain_text + "\0" + problem_text).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, f"{key}.soln")
+        if os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                return [line.strip() for line in f if line.strip()]
+
+    domain, problem = parse_domain(domain_text), parse_problem(problem_text)
+    if problem.domain_name != domain.name:
+        raise ValueError(f"Problem {task_file} is for domain '{problem.domain_name}', not '{domain.name}'")
+    commands = plan(domain, problem)
+    if commands is None:
+        raise ValueError(f"No plan found for {task_file}")
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, "w") as f:
+            f.write("".join(command + "\n" for command in commands))
+    return commands
+
+def missing_skills(commands, skill_library):
+    # Actions of the plan that no learned skill can execute
+    return sorted({ command.strip("()").split()[0] for command in commands } - set(skill_library.keys()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan a PDDL problem from tasks/")
+    parser.add_argument("task", help="Problem file, its domain.pddl is expected in the same folder")
+    parser.add_argument("--domain", default=None)
+    parser.add_argument("--cache", default="plan_cache", help="Plan cache folder")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--write-solution", action="store_true", help="Also write the plan to <task>.soln")
+    args = parser.parse_args(argv)
+
+    try:
+        commands = solve(args.task, args.domain, None if args.no_cache else args.cache)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    for command in commands:
+        print(command)
+    if args.write_solution:
+        with open(args.task + ".soln", "w") as f:
+            f.write("".join(command + "\n" for command in commands))
+
+if __name__ == "__main__":
+    main()
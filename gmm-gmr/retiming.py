@@ -0,0 +1,80 @@
+import numpy as np
+
+def precision_speed_scale(covariances, precision_std=0.01, min_scale=0.2):
+    """
+    Per-waypoint speed scale from the GMR covariance. Where the demonstrations agreed closely
+    (standard deviation below precision_std) the path is precision critical and the robot slows
+    down proportionally; elsewhere it may move at full speed.
+
+    :param covariances: (T, D, D) spatial covariances of the GMR trajectory.
+    :return: (T,) scale factors in [min_scale, 1].
+    """
+    std = np.sqrt(np.maximum(np.trace(covariances, axis1=1, axis2=2) / covariances.shape[1], 0.0))
+    return np.clip(std / precision_std, min_scale, 1.0)
+
+def retime_trajectory(trajectory, covariances=None, v_max=0.5, a_max=1.0, dt=0.05, precision_std=0.01, min_scale=0.2):
+    """
+    Time-optimal timing of a piecewise linear path under end-effector speed and acceleration
+    limits, computed with a forward and a backward pass over the waypoints.
+
+    :param trajectory: (T, D) GMR waypoints.
+    :param covariances: Optional (T, D, D) GMR covariances used to lower the speed limit in
+        precision critical segments.
+    :param v_max: Maximum end-effector speed (m/s).
+    :param a_max: Maximum end-effector acceleration (m/s^2), also bounding cornering speed.
+    :param dt: Sampling period of the returned trajectory, normally the control period.
+    :return: A tuple (times, samples, waypoint_times) with the retimed trajectory sampled every
+        dt seconds and the time at which each input waypoint is reached.
+    """
+    segments = np.diff(trajectory, axis=0)
+    lengths = np.linalg.norm(segments, axis=1)
+    arc = np.concatenate(([0.0], np.cumsum(lengths)))
+
+    # Speed limit at each waypoint
+    v_limit = np.full(len(trajectory), v_max)
+    if covariances is not None:
+        v_limit *= precision_speed_scale(covariances, precision_std, min_scale)
+    # Cruise speed of a segment that starts and ends at rest, before corners and endpoints are applied
+    v_cruise = np.minimum(v_limit[:-1], v_limit[1:])
+    # Turning through a corner changes the velocity direction; bound it by the acceleration limit
+    directions = segments / np.maximum(lengths, 1e-12)[:, None]
+    turn = np.linalg.norm(np.diff(directions, axis=0), axis=1)
+    corner_length = np.minimum(lengths[:-1], lengths[1:])
+    v_corner = np.sqrt(a_max * corner_length / np.maximum(turn, 1e-12))
+    v_limit[1:-1] = np.minimum(v_limit[1:-1], v_corner)
+    v_limit[0] = v_limit[-1] = 0.0
+
+    # Forward pass (acceleration), backward pass (deceleration)
+    v = v_limit.copy()
+    for i in range(1, len(v)):
+        v[i] = min(v[i], np.sqrt(v[i - 1] ** 2 + 2 * a_max * lengths[i - 1]))
+    for i in range(len(v) - 2, -1, -1):
+        v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2 * a_max * lengths[i]))
+
+    # Constant acceleration within each segment, except where it starts and ends at rest (e.g. a path
+    # without interior waypoints): that one accelerates at a_max to a peak speed, cruises and brakes
+    at_rest = (v[:-1] == 0.0) & (v[1:] == 0.0) & (lengths > 0)
+    peak = np.where(at_rest, np.minimum(v_cruise, np.sqrt(a_max * lengths)), 0.0)
+    mean_speed = np.maximum((v[:-1] + v[1:]) / 2, 1e-9)
+    durations = np.where(at_rest, lengths / np.maximum(peak, 1e-9) + peak / a_max,
+                         np.where(lengths > 0, lengths / mean_speed, 0.0))
+    waypoint_times = np.concatenate(([0.0], np.cumsum(durations)))
+
+    times = np.arange(0.0, waypoint_times[-1] + dt, dt)
+    times[-1] = min(times[-1], waypoint_times[-1])
+    seg = np.clip(np.searchsorted(waypoint_times, times, side='right') - 1, 0, len(lengths) - 1)
+    tau = times - waypoint_times[seg]
+    accel = np.where(durations[seg] > 0, (v[seg + 1] - v[seg]) / np.maximum(durations[seg], 1e-12), 0.0)
+    s = arc[seg] + v[seg] * tau + 0.5 * accel * tau ** 2
+    # Trapezoidal (triangular when the peak is sqrt(a_max * length)) profile of the segments at rest
+    ramp = peak[seg] / a_max
+    braking = np.maximum(durations[seg] - tau, 0.0)
+    trapezoid = np.where(tau < ramp, 0.5 * a_max * tau ** 2,
+                         np.where(braking > ramp, 0.5 * peak[seg] * ramp + peak[seg] * (tau - ramp),
+                                  lengths[seg] - 0.5 * a_max * braking ** 2))
+    s = np.minimum(np.where(at_rest[seg], arc[seg] + trapezoid, s), arc[seg + 1])
+
+    # Position along the path at arc length s
+    fraction = np.where(lengths[seg] > 0, (s - arc[seg]) / np.maximum(lengths[seg], 1e-12), 0.0)
+    samples = trajectory[seg] + fraction[:, None] * segments[seg]
+    return times, samples, waypoint_times
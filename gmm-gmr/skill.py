@@ -6,10 +6,17 @@ class TrajectoryData:
     trajectory: list
     gr_initial: bool = False,
     gr_final: bool = False
+    retimed_times: list = None
+    retimed_trajectory: list = None
+    waypoint_indices: list = None
+    covariances: list = None
+    lookup_table: object = None
 
 class Skill:
-    def __init__(self, timestamps, trajectory, attributes):
-        self._traj_data = TrajectoryData(timestamps, trajectory, attributes["grip_initial"], attributes["grip_final"])
+    def __init__(self, timestamps, trajectory, attributes, retimed_times=None, retimed_trajectory=None, waypoint_indices=None,
+                 covariances=None, lookup_table=None):
+        self._traj_data = TrajectoryData(timestamps, trajectory, attributes["grip_initial"], attributes["grip_final"],
+                                         retimed_times, retimed_trajectory, waypoint_indices, covariances, lookup_table)
         self._name = attributes["skill_name"]
         self._target = attributes["target_idx"]
 
@@ -25,6 +32,31 @@ class Skill:
     def trajectory_data(self):
         return self._traj_data.times, self._traj_data.trajectory
 
+    def waypoint_data(self):
+        # Simplified trajectory, or every GMR point if the skill was not simplified
+        indices = self._traj_data.waypoint_indices
+        if indices is None:
+            return self.trajectory_data()
+        return self._traj_data.times[indices], self._traj_data.trajectory[indices]
+
+    def waypoint_covariances(self):
+        # GMR covariance at each waypoint, None for skills saved without it
+        covariances = self._traj_data.covariances
+        if covariances is None or self._traj_data.waypoint_indices is None:
+            return covariances
+        return covariances[self._traj_data.waypoint_indices]
+
+    def covariances(self):
+        return self._traj_data.covariances
+
+    def lookup_table(self):
+        return self._traj_data.lookup_table
+
+    def retimed_trajectory_data(self):
+        if self._traj_data.retimed_trajectory is None:
+            return None
+        return self._traj_data.retimed_times, self._traj_data.retimed_trajectory
+
     def grip_initial(self):
         return self._traj_data.gr_initial
 
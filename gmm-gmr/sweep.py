@@ -0,0 +1,175 @@
+import os
+import io
+import sys
+sys.path.append('..')
+import csv
+import time
+import argparse
+import itertools
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from demonstration_collection.smooth_demonstrations import smooth_trajectory
+from main import load_demonstrations
+from mixtures import COVARIANCE_TYPES, GMM_GMR
+from utils import align_to_reference
+
+results_dir = "sweeps"
+
+# Aligned and smoothed demonstrations, shared by every grid point a worker evaluates
+_fold_cache = {}
+
+def parse_components(spec):
+    # "2-6" -> [2, 3, 4, 5, 6], "2,4,6" -> [2, 4, 6]
+    if "-" in spec:
+        low, high = spec.split("-")
+        return tuple(range(int(low), int(high) + 1))
+    return tuple(int(c) for c in spec.split(","))
+
+def make_folds(n_demos, n_folds):
+    # Leave-one-out when there are few demonstrations, otherwise round-robin folds
+    n_folds = min(n_folds, n_demos)
+    return [list(range(i, n_demos, n_folds)) for i in range(n_folds)]
+
+def build_fold_cache(skill_demos, smooth_samples, n_folds):
+    cache = {}
+    for skill_name, entry in skill_demos.items():
+        demos = entry["demos"]
+        if len(demos) < 2:
+            print(f"Skipping skill '{skill_name}', at least 2 demonstrations are needed for held-out scoring!")
+            continue
+        for num_samples in smooth_samples:
+            smoothed = [smooth_trajectory(d, num_samples=num_samples, kind='cubic') for d in demos]
+            for fold, held_out in enumerate(make_folds(len(smoothed), n_folds)):
+                train = [d for i, d in enumerate(smoothed) if i not in held_out]
+                # Same reference choice as align_trajectories, so the held-out demos share the time axis
+                reference = train[np.argmax([d.shape[0] for d in train])]
+                train_aligned = np.array([align_to_reference(reference, d) for d in train])
+                test_aligned = np.array([align_to_reference(reference, smoothed[i]) for i in held_out])
+                cache[(skill_name, num_samples, fold)] = (train_aligned, test_aligned)
+    return cache
+
+def _init_worker(cache):
+    global _fold_cache
+    _fold_cache = cache
+
+def reconstruction_error(times, trj, test_aligned, demo_duration):
+    # Mean distance between the held-out demos and the piecewise linear skill trajectory
+    T = test_aligned.shape[1]
+    test_times = np.arange(T) * demo_duration / T
+    estimate = np.stack([np.interp(test_times, times, trj[:, j]) for j in range(trj.shape[1])], axis=1)
+    return float(np.mean(np.linalg.norm(test_aligned - estimate[None], axis=2)))
+
+def evaluate_grid_point(point):
+    skill_name, smooth_samples, pca_components, components, covariance_types, gmr_samples, demo_duration, n_folds, seed = point
+    fit_times, eval_times, errors, selected, selected_types = [], [], [], [], []
+    for fold in range(n_folds):
+        train_aligned, test_aligned = _fold_cache[(skill_name, smooth_samples, fold)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            gmm_gmr = GMM_GMR(train_aligned, pca_components, demo_duration=demo_duration)
+            start = time.perf_counter()
+            gmm_gmr.fit(components, random_state=seed, covariance_types=covariance_types)
+            fit_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        times, trj = gmm_gmr.generate_trajectory(num_samples=gmr_samples)
+        eval_times.append(time.perf_counter() - start)
+        errors.append(reconstruction_error(times, trj, test_aligned, demo_duration))
+        selected.append(gmm_gmr.gmm.n_components)
+        selected_types.append(gmm_gmr.gmm.covariance_type)
+    return {
+        "skill_name": skill_name,
+        "smooth_samples": smooth_samples,
+        "pca_components": pca_components,
+        "components": f"{components[0]}-{components[-1]}" if len(components) > 1 else str(components[0]),
+        "covariance_types": "/".join(covariance_types),
+        "gmr_samples": gmr_samples,
+        "demo_duration": demo_duration,
+        "selected_mixtures": int(np.median(selected)),
+        "selected_covariance": max(set(selected_types), key=selected_types.count),
+        "error": float(np.mean(errors)),
+        "error_std": float(np.std(errors)),
+        "fit_time": float(np.mean(fit_times)),
+        "eval_time": float(np.mean(eval_times)),
+    }
+
+def run_sweep(skill_demos, smooth_samples, pca_components, components, gmr_samples, demo_durations,
+              n_folds=5, seed=0, max_workers=None, covariance_types=(COVARIANCE_TYPES,)):
+    cache = build_fold_cache(skill_demos, smooth_samples, n_folds)
+    skill_folds = {}
+    for skill_name, num_samples, fold in cache.keys():
+        skill_folds[skill_name] = max(skill_folds.get(skill_name, 0), fold + 1)
+
+    grid = [
+        (skill_name, s, p, c, t, g, d, skill_folds[skill_name], seed)
+        for skill_name in skill_folds
+        for s, p, c, t, g, d in itertools.product(smooth_samples, pca_components, components, covariance_types,
+                                                  gmr_samples, demo_durations)
+    ]
+    print(f"Evaluating {len(grid)} grid points...")
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(cache,)) as executor:
+        return list(executor.map(evaluate_grid_point, grid))
+
+def best_configurations(rows, max_error):
+    # Fastest configuration (fit + GMR evaluation) per skill that meets the accuracy bar
+    best = {}
+    for row in sorted(rows, key=lambda r: r["fit_time"] + r["eval_time"]):
+        if row["error"] <= max_error and row["skill_name"] not in best:
+            best[row["skill_name"]] = row
+    return best
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(f"{row[c]:.5f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
+
+def save_table(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Sweep results saved to {path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep for GMM-GMR skill fitting")
+    parser.add_argument("--demos", default="../demonstration_collection/demonstrations", help="Folder of raw demonstrations")
+    parser.add_argument("--smooth-samples", type=int, nargs="+", default=[30, 50, 100])
+    parser.add_argument("--pca-components", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--components", type=parse_components, nargs="+", default=[(2, 3, 4, 5, 6)],
+                        help="BIC candidate ranges, e.g. 2-6 or 2,4,6")
+    parser.add_argument("--covariance-types", type=lambda spec: tuple(spec.split(",")), nargs="+", default=[COVARIANCE_TYPES],
+                        help="BIC candidate covariance structures, e.g. full or full,diag,tied")
+    parser.add_argument("--gmr-samples", type=int, nargs="+", default=[50, 100])
+    parser.add_argument("--demo-durations", type=float, nargs="+", default=[100.0])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-error", type=float, default=None, help="Accuracy bar used to pick the fastest configuration")
+    args = parser.parse_args(argv)
+
+    sk_demos = load_demonstrations(args.demos, dataset_key='eef_positions')
+    if not sk_demos:
+        print("No demonstrations available...")
+        sys.exit()
+
+    rows = run_sweep(sk_demos, args.smooth_samples, args.pca_components, args.components, args.gmr_samples,
+                     args.demo_durations, n_folds=args.folds, seed=args.seed, max_workers=args.workers,
+                     covariance_types=args.covariance_types)
+    rows.sort(key=lambda r: (r["skill_name"], r["error"]))
+    print_table(rows)
+
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    save_table(rows, os.path.join(results_dir, f"sweep_{int(time.time())}.csv"))
+
+    if args.max_error is not None:
+        best = best_configurations(rows, args.max_error)
+        for skill_name in sorted({r["skill_name"] for r in rows}):
+            if skill_name in best:
+                print(f"\nFastest configuration for '{skill_name}' within {args.max_error}:")
+                print_table([best[skill_name]])
+            else:
+                print(f"\nNo configuration for '{skill_name}' meets the error bar {args.max_error}")
+
+if __name__ == "__main__":
+    main()
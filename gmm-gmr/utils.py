@@ -10,23 +10,60 @@ which is based on the following paper:
 This adaptation is provided under the same licensing terms as the original repository.
 """
 
-from dtw import dtw
 import numpy as np
 import math
 
+def dtw_path(reference, d):
+    from dtw import dtw
+    dist, cost, acc, path = dtw(reference, d,
+                                dist=lambda x, y: np.linalg.norm(x - y, ord=1))
+    return np.asarray(path[0], dtype=int), np.asarray(path[1], dtype=int)
+
+def path_cost(reference, d, path):
+    # Mean L1 distance between the matched samples, comparable across trajectory lengths
+    return np.mean(np.sum(np.abs(reference[path[0]] - d[path[1]]), axis=1))
+
+def align_to_reference(reference, d, return_cost=False):
+    path = dtw_path(reference, d)
+    aligned = d[path[1]][:reference.shape[0]]
+    if return_cost:
+        return aligned, path_cost(reference, d, path)
+    return aligned
+
 def align_trajectories(data):
     ls = np.argmax([d.shape[0] for d in data])
 
     data_warp = []
 
     for d in data:
-        dist, cost, acc, path = dtw(data[ls], d,
-                                    dist=lambda x, y: np.linalg.norm(x - y, ord=1))
-
-        data_warp += [d[path[1]][:data[ls].shape[0]]]
+        data_warp += [align_to_reference(data[ls], d)]
 
     return data_warp
 
+def dtw_barycenter_average(data, template, n_iterations=10, tol=1e-6):
+    """
+    DTW barycenter averaging (Petitjean et al., 2011): every template sample moves to the mean of
+    the demonstration samples DTW matches it with, until the template stops changing.
+
+    :param data: List of (T_i, D) trajectories.
+    :param template: (T, D) initial template, its length is kept.
+    :return: The (T, D) template.
+    """
+    template = np.array(template, dtype=float)
+    for _ in range(n_iterations):
+        sums = np.zeros_like(template)
+        counts = np.zeros(len(template))
+        for d in data:
+            path = dtw_path(template, d)
+            np.add.at(sums, path[0], d[path[1]])
+            np.add.at(counts, path[0], 1)
+        updated = sums / counts[:, None]
+        change = np.max(np.abs(updated - template))
+        template = updated
+        if change < tol:
+            break
+    return template
+
 def gaussian(x, mu, var):
     exponent = -((x - mu) ** 2) / (2 * var)
     return (1 / math.sqrt((2 * math.pi * var))) * math.exp(exponent)
@@ -0,0 +1,60 @@
+import numpy as np
+
+def variance_tolerances(covariances, scale=0.5, min_tolerance=0.002, max_tolerance=0.02):
+    """
+    Per-point simplification tolerance from the GMR covariance: where the demonstrations varied
+    widely the path may deviate more from the GMR mean.
+
+    :param covariances: (T, D, D) spatial covariances of the GMR trajectory.
+    :return: (T,) tolerances in the trajectory units.
+    """
+    std = np.sqrt(np.maximum(np.trace(covariances, axis1=1, axis2=2) / covariances.shape[1], 0.0))
+    return np.clip(scale * std, min_tolerance, max_tolerance)
+
+def acceptance_thresholds(covariances, scale=2.0, min_threshold=0.01, max_threshold=0.05):
+    """
+    Per-waypoint convergence threshold for the executor: loose where the demonstrations varied
+    widely (free-space transit), tight where they agreed (grasp and place).
+
+    :param covariances: (T, D, D) GMR covariances at the waypoints.
+    :return: (T,) thresholds on the end-effector position error.
+    """
+    return variance_tolerances(covariances, scale, min_threshold, max_threshold)
+
+def point_segment_distances(points, start, end):
+    segment = end - start
+    length_sq = segment.dot(segment)
+    if length_sq == 0:
+        return np.linalg.norm(points - start, axis=1)
+    fraction = np.clip((points - start).dot(segment) / length_sq, 0.0, 1.0)
+    return np.linalg.norm(points - (start + fraction[:, None] * segment), axis=1)
+
+def simplify_trajectory(trajectory, tolerances):
+    """
+    Ramer-Douglas-Peucker simplification with a tolerance per point.
+
+    :param trajectory: (T, D) GMR waypoints.
+    :param tolerances: Scalar or (T,) maximum allowed distance of each dropped point from the
+        simplified path.
+    :return: Sorted indices of the waypoints to keep, always including the first and last.
+    """
+    T = len(trajectory)
+    tolerances = np.broadcast_to(tolerances, (T,))
+    keep = np.zeros(T, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, T - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = slice(first + 1, last)
+        distances = point_segment_distances(trajectory[inner], trajectory[first], trajectory[last])
+        excess = distances - tolerances[inner]
+        worst = int(np.argmax(excess))
+        if excess[worst] > 0:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import argparse
+import importlib
+import multiprocessing
+from dataclasses import dataclass, field
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.join(BASE_DIR, "demonstration_collection")
+GMM_DIR = os.path.join(BASE_DIR, "gmm-gmr")
+RAW_DIR = os.path.join(DEMO_DIR, "demonstrations")
+SMOOTHED_DIR = os.path.join(DEMO_DIR, "smoothed_demonstrations")
+SKILLS_DIR = os.path.join(GMM_DIR, "skills")
+TASKS_DIR = os.path.join(BASE_DIR, "tasks")
+STATE_FILE = os.path.join(BASE_DIR, ".pipeline_state.json")
+
+# Imported once up front; stages run in this interpreter or in forks of it
+HEAVY_MODULES = ["numpy", "h5py", "scipy.interpolate", "sklearn.mixture", "sklearn.decomposition", "matplotlib.pyplot"]
+SIM_MODULES = ["robosuite", "mujoco", "pygame"]
+
+sys.path[:0] = [BASE_DIR, DEMO_DIR, GMM_DIR]
+
+
+@dataclass
+class Stage:
+    name: str
+    inputs: callable
+    outputs: callable
+    run: callable
+    cwd: str
+    deps: list = field(default_factory=list)
+    interactive: bool = False
+    # Maps an input to the output it produces, for stages with one output per input
+    output_of: callable = None
+
+
+def h5_files(folder_path):
+    if not os.path.exists(folder_path):
+        return []
+    return sorted(os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.h5'))
+
+def task_files():
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(TASKS_DIR) for f in files
+                  if f.endswith('.pddl') or f.endswith('.soln'))
+
+def signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f, indent=1)
+
+def changed_inputs(stage, state):
+    """
+    :return: The inputs the stage has to (re)process, the inputs removed since it last succeeded
+        (both None if the stage is up to date), and the current input signatures.
+    """
+    previous = state.get(stage.name)
+    current = {path: signature(path) for path in stage.inputs()}
+    if previous is None:
+        return list(current), [], current
+    changed = [path for path, sig in current.items() if previous.get(path) != sig]
+    removed = [path for path in previous if path not in current]
+    if stage.output_of is not None:
+        # Inputs whose own output went missing are processed again
+        changed += [path for path in current if path not in changed and not os.path.exists(stage.output_of(path))]
+    elif any(not os.path.exists(path) for path in stage.outputs()):
+        changed = list(current)
+    if not changed and not removed:
+        return None, None, current
+    return changed, removed, current
+
+
+# Stage implementations
+
+def smoothed_path(raw_file_path):
+    return os.path.join(SMOOTHED_DIR, "smoothed_" + os.path.basename(raw_file_path))
+
+def run_collect(num_demos):
+    def run(changed, removed):
+        import collect_demonstration
+        for i in range(1, num_demos + 1):
+            print(f"Run {i}: Executing collect_demonstration.py...")
+            collect_demonstration.main([])
+    return run
+
+def run_smooth(changed, removed):
+    from smooth_demonstrations import smooth_demonstration_file
+    if not os.path.exists(SMOOTHED_DIR):
+        os.makedirs(SMOOTHED_DIR)
+    for raw_file_path in changed:
+        smooth_demonstration_file(raw_file_path, smoothed_path(raw_file_path))
+    # A removed raw demo must not keep feeding training through its smoothed copy
+    for raw_file_path in removed:
+        if os.path.exists(smoothed_path(raw_file_path)):
+            os.remove(smoothed_path(raw_file_path))
+            print(f"Removed {smoothed_path(raw_file_path)}")
+
+def run_module(module_name, *args):
+    def run(changed, removed):
+        importlib.import_module(module_name).main(*args)
+    return run
+
+def run_train(changed, removed):
+    import h5py
+    import main
+    # Only the skills with new or modified demonstrations are retrained
+    skill_names = set()
+    for path in changed:
+        with h5py.File(path, "r") as f:
+            if "skill_name" in f.attrs.keys():
+                skill_names.add(f.attrs["skill_name"])
+    if removed:
+        # The skill of a removed demo can no longer be read, so every skill is retrained
+        skill_names = None
+    skill_files = main.find_demonstrations(SMOOTHED_DIR, dataset_key='eef_positions')
+    if skill_names is not None:
+        skill_files = { name: entry for name, entry in skill_files.items() if name in skill_names }
+    for _, demos in main.iter_skill_demonstrations(skill_files, dataset_key='eef_positions'):
+        main.learn_skill(demos)
+
+def build_stages(num_demos):
+    return [
+        Stage("collect", lambda: [], lambda: [], run_collect(num_demos), DEMO_DIR, interactive=True),
+        Stage("plot_raw", lambda: h5_files(RAW_DIR),
+              lambda: [os.path.join(DEMO_DIR, "plots", "all_demos_3d.png")],
+              run_module("graph_all_demonstrations"), DEMO_DIR, deps=["collect"]),
+        Stage("smooth", lambda: h5_files(RAW_DIR),
+              lambda: [smoothed_path(p) for p in h5_files(RAW_DIR)],
+              run_smooth, DEMO_DIR, deps=["collect"], output_of=smoothed_path),
+        Stage("plot_smoothed", lambda: h5_files(SMOOTHED_DIR),
+              lambda: [os.path.join(DEMO_DIR, "plots", "all_smoothed_demos_3d.png")],
+              run_module("graph_all_smoothed_demonstrations"), DEMO_DIR, deps=["smooth"]),
+        Stage("train", lambda: h5_files(SMOOTHED_DIR), lambda: [], run_train, GMM_DIR, deps=["smooth"]),
+        Stage("apply", lambda: h5_files(SKILLS_DIR) + task_files(), lambda: [],
+              run_module("apply_skill_to_block", []), GMM_DIR, deps=["train"], interactive=True),
+    ]
+
+def _run_in_child(stage, changed, removed):
+    os.chdir(stage.cwd)
+    stage.run(changed, removed)
+
+def run_pipeline(stages, force=(), jobs=2):
+    state = load_state()
+    done = set()
+    failed = set()
+    running = {}
+    pending = list(stages)
+    context = multiprocessing.get_context("fork")
+    # Dependencies on stages left out of this run count as satisfied
+    names = {stage.name for stage in stages}
+    done.update(dep for stage in stages for dep in stage.deps if dep not in names)
+
+    def finish(stage, current):
+        state[stage.name] = current
+        save_state(state)
+        done.add(stage.name)
+
+    while pending or running:
+        # Start every stage whose dependencies are done
+        for stage in list(pending):
+            if any(dep in failed for dep in stage.deps):
+                print(f"Skipping {stage.name}, a dependency failed")
+                pending.remove(stage)
+                failed.add(stage.name)
+                continue
+            if not all(dep in done for dep in stage.deps):
+                continue
+            changed, removed, current = changed_inputs(stage, state)
+            if changed is None and stage.name not in force:
+                print(f"{stage.name}: up to date")
+                pending.remove(stage)
+                done.add(stage.name)
+                continue
+            if stage.name in force:
+                changed = list(current)
+                removed = removed or []
+            if stage.interactive:
+                # Interactive stages own the terminal and the viewer, so they run alone in this process
+                if running:
+                    continue
+                pending.remove(stage)
+                print(f"Running {stage.name}...")
+                cwd = os.getcwd()
+                os.chdir(stage.cwd)
+                try:
+                    stage.run(changed, removed)
+                    finish(stage, {path: signature(path) for path in stage.inputs()})
+                except (Exception, SystemExit) as e:
+                    print(f"{stage.name} failed: {e}")
+                    failed.add(stage.name)
+                finally:
+                    os.chdir(cwd)
+            elif len(running) < jobs:
+                pending.remove(stage)
+                print(f"Running {stage.name} ({len(changed)} changed inputs)...")
+                process = context.Process(target=_run_in_child, args=(stage, changed, removed))
+                process.start()
+                running[stage.name] = (stage, process, current)
+
+        # Wait for one of the running stages to finish
+        for name, (stage, process, current) in list(running.items()):
+            process.join(timeout=0.1)
+            if process.exitcode is None:
+                continue
+            del running[name]
+            if process.exitcode == 0:
+                finish(stage, current)
+            else:
+                print(f"{name} failed with exit code {process.exitcode}")
+                failed.add(name)
+    return not failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental collect -> smooth -> plot -> train -> apply pipeline")
+    parser.add_argument("--collect", type=int, default=None, help="Number of demonstrations to collect (prompted if omitted)")
+    parser.add_argument("--force", nargs="*", default=[], help="Stages to rerun even if their inputs did not change")
+    parser.add_argument("--skip", nargs="*", default=[], help="Stages to leave out, e.g. apply")
+    parser.add_argument("--jobs", type=int, default=2, help="Maximum number of stages running concurrently")
+    args = parser.parse_args()
+
+    num_demos = args.collect
+    if num_demos is None:
+        answer = input("Enter the number of demonstrations you would like to collect: ")
+        num_demos = int(answer) if answer.strip() else 0
+    force = set(args.force)
+    if num_demos > 0:
+        force.add("collect")
+
+    # Plots are saved to disk, showing them would block the forked stages
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    stages = [s for s in build_stages(num_demos) if s.name not in args.skip]
+    modules = HEAVY_MODULES + (SIM_MODULES if num_demos > 0 or any(s.name == "apply" for s in stages) else [])
+    for module in modules:
+        importlib.import_module(module)
+
+    if not run_pipeline(stages, force=force, jobs=args.jobs):
+        sys.exit(1)
+    print("Pipeline execution complete.")